@@ -7,8 +7,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.routers import auth, users, portfolios, market, alerts, research, chat, call_requests, snapshots, ai_research, invites, news, price_alerts, reports, watchlists, push
 from app.routers import websocket as ws_router_module
+from app.services.http_clients import close_http_clients
 from app.services.kite_service import kite_service
 from app.services.scheduler import start_scheduler, stop_scheduler
+from app.services.supabase_client import close_supabase_admin_async
 
 logging.basicConfig(level=logging.INFO)
 
@@ -25,6 +27,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     stop_scheduler()
     await kite_service.stop()
+    await research.close_http_client()
+    await reports.close_http_client()
+    reports.shutdown_pdf_pool()
+    await close_supabase_admin_async()
+    await close_http_clients()
 
 
 def create_app() -> FastAPI:
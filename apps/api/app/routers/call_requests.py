@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from app.dependencies import get_current_user
 from app.models.call_request import CallRequestCreate, CallRequestResponse
-from app.services.alerts import create_alert
+from app.services.alerts import create_alerts_bulk
 from app.services.supabase_client import get_supabase_admin
 
 router = APIRouter()
@@ -44,20 +44,22 @@ async def create_call_request(body: CallRequestCreate, user=Depends(get_current_
         .execute()
     )
 
-    # Notify both parties
-    create_alert(
-        user.id,
-        "call_scheduled",
-        f"Your call request has been submitted for {body.preferred_datetime}. "
-        f"Your fund manager will confirm shortly.",
-    )
-    create_alert(
-        manager_id,
-        "call_request",
-        f"Client {client_name} has requested a call. "
-        f"Preferred time: {body.preferred_datetime}. "
-        f"Contact: {body.contact_method} — {body.contact_value}",
-    )
+    # Notify both parties in one insert
+    await create_alerts_bulk([
+        {
+            "user_id": user.id,
+            "type": "call_scheduled",
+            "message": f"Your call request has been submitted for {body.preferred_datetime}. "
+                       f"Your fund manager will confirm shortly.",
+        },
+        {
+            "user_id": manager_id,
+            "type": "call_request",
+            "message": f"Client {client_name} has requested a call. "
+                       f"Preferred time: {body.preferred_datetime}. "
+                       f"Contact: {body.contact_method} — {body.contact_value}",
+        },
+    ])
 
     return result.data[0]
 
@@ -58,13 +58,13 @@ async def chat(body: ChatRequest, user=Depends(get_current_user)):
 
     if role == "client":
         try:
-            ctx = await asyncio.to_thread(build_client_context, user.id)
+            ctx = await build_client_context(user.id)
             system_prompt = format_client_system_prompt(ctx)
         except Exception:
             system_prompt = MANAGER_SYSTEM_PROMPT
     else:
         try:
-            ctx = await asyncio.to_thread(build_manager_context, user.id)
+            ctx = await build_manager_context(user.id)
             system_prompt = format_manager_system_prompt(ctx)
         except Exception:
             system_prompt = MANAGER_SYSTEM_PROMPT
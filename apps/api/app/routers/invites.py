@@ -5,7 +5,7 @@ Allows fund managers to invite clients via email.
 Clients can accept invites and automatically get linked to their manager.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta, timezone
 from typing import Optional
@@ -73,6 +73,7 @@ def get_invite_url(token: str) -> str:
 @router.post("", response_model=InviteResponse, status_code=status.HTTP_201_CREATED)
 async def create_invite(
     invite_data: InviteCreate,
+    background_tasks: BackgroundTasks,
     current_user=Depends(require_manager)
 ):
     """
@@ -85,7 +86,7 @@ async def create_invite(
     manager_id = current_user.id
 
     # Check if user with this email already exists
-    existing_user = supabase.table("users").select("*").eq("email", invite_data.email).execute()
+    existing_user = supabase.table("users").select("id").eq("email", invite_data.email).execute()
     if existing_user.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -94,7 +95,7 @@ async def create_invite(
 
     # Check if there's already a pending invite for this email from this manager
     existing_invite = supabase.table("invites")\
-        .select("*")\
+        .select("id")\
         .eq("manager_id", manager_id)\
         .eq("client_email", invite_data.email)\
         .eq("status", "pending")\
@@ -129,14 +130,16 @@ async def create_invite(
 
     invite_record = invite.data[0]
 
-    # Send invite email (non-blocking — failure just logs a warning)
+    # Send invite email after the response goes out — failure just logs a warning
     manager_name = (current_user.user_metadata or {}).get("full_name", "Your portfolio manager")
     invite_url = get_invite_url(invite_token)
-    send_invite_email(invite_data.email, invite_data.full_name, manager_name, invite_url)
+    background_tasks.add_task(
+        send_invite_email, invite_data.email, invite_data.full_name, manager_name, invite_url
+    )
 
     return {
         **invite_record,
-        "invite_url": get_invite_url(invite_token)
+        "invite_url": invite_url
     }
 
 
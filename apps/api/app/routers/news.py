@@ -8,17 +8,18 @@ Sources (all public RSS feeds from Indian financial publishers):
 """
 import asyncio
 import hashlib
+import io
 import re
 import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
 from email.utils import parsedate_to_datetime
 from urllib.parse import quote
 
-import httpx
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 
 from app.dependencies import get_current_user
+from app.services.http_clients import get_rss_client
 
 router = APIRouter()
 
@@ -45,6 +46,9 @@ RESULTS_FEEDS = [
     "https://www.livemint.com/rss/companies",
 ]
 
+# Tokens in the ?symbols= list; allows tickers like M&M and BAJAJ-AUTO
+_SYMBOL_RE = re.compile(r"[^,\s]+")
+
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
@@ -63,98 +67,101 @@ def _make_id(value: str) -> str:
     return hashlib.md5(value.encode()).hexdigest()
 
 
-def _parse_rss(xml_text: str, symbols: list[str]) -> list["NewsItem"]:
+def _parse_rss(xml_data: bytes, symbols: list[str]) -> list["NewsItem"]:
+    # Stream-parse so peak memory stays at one <item> rather than the whole feed
     items: list[NewsItem] = []
     try:
-        root = ET.fromstring(xml_text)
+        for _, item in ET.iterparse(io.BytesIO(xml_data), events=("end",)):
+            if item.tag != "item":
+                continue
+            news_item = _parse_item(item, symbols)
+            item.clear()
+            if news_item is not None:
+                items.append(news_item)
     except ET.ParseError:
-        return items
-
-    channel = root.find("channel") or root
-    for item in channel.findall("item"):
-        title_raw = (item.findtext("title") or "").strip()
-        url = (item.findtext("link") or "").strip()
-        guid = (item.findtext("guid") or url).strip()
-        pub_raw = (item.findtext("pubDate") or "").strip()
-        desc_raw = (item.findtext("description") or "").strip()
-
-        if not title_raw or not url:
-            continue
-
-        # Extract publisher from <source> element or " - Publisher" suffix
-        source_el = item.find("source")
-        if source_el is not None and source_el.text:
-            source = source_el.text.strip()
-            title = _strip_html(title_raw)
-        elif " - " in title_raw:
-            parts = title_raw.rsplit(" - ", 1)
-            title = _strip_html(parts[0])
-            source = parts[1].strip()
+        pass
+    return items
+
+
+def _parse_item(item: ET.Element, symbols: list[str]) -> "NewsItem | None":
+    title_raw = (item.findtext("title") or "").strip()
+    url = (item.findtext("link") or "").strip()
+    guid = (item.findtext("guid") or url).strip()
+    pub_raw = (item.findtext("pubDate") or "").strip()
+    desc_raw = (item.findtext("description") or "").strip()
+
+    if not title_raw or not url:
+        return None
+
+    # Extract publisher from <source> element or " - Publisher" suffix
+    source_el = item.find("source")
+    if source_el is not None and source_el.text:
+        source = source_el.text.strip()
+        title = _strip_html(title_raw)
+    elif " - " in title_raw:
+        parts = title_raw.rsplit(" - ", 1)
+        title = _strip_html(parts[0])
+        source = parts[1].strip()
+    else:
+        title = _strip_html(title_raw)
+        source = ""
+
+    # Fallback: infer source from URL domain
+    if not source:
+        if "economictimes" in url:
+            source = "Economic Times"
+        elif "moneycontrol" in url:
+            source = "MoneyControl"
+        elif "livemint" in url:
+            source = "LiveMint"
+        elif "business-standard" in url:
+            source = "Business Standard"
+        elif "financialexpress" in url:
+            source = "Financial Express"
         else:
-            title = _strip_html(title_raw)
-            source = ""
-
-        # Fallback: infer source from URL domain
-        if not source:
-            if "economictimes" in url:
-                source = "Economic Times"
-            elif "moneycontrol" in url:
-                source = "MoneyControl"
-            elif "livemint" in url:
-                source = "LiveMint"
-            elif "business-standard" in url:
-                source = "Business Standard"
-            elif "financialexpress" in url:
-                source = "Financial Express"
-            else:
-                source = "Market News"
-
-        summary = _strip_html(desc_raw)[:200] if desc_raw else ""
-
-        try:
-            pub_dt = parsedate_to_datetime(pub_raw)
-            published_at = pub_dt.astimezone(timezone.utc).isoformat()
-        except Exception:
-            published_at = datetime.now(timezone.utc).isoformat()
-
-        items.append(
-            NewsItem(
-                id=_make_id(guid),
-                title=title,
-                summary=summary,
-                url=url,
-                source=source,
-                published_at=published_at,
-                symbols=symbols,
-                thumbnail=None,
-            )
-        )
+            source = "Market News"
 
-    return items
+    summary = _strip_html(desc_raw)[:200] if desc_raw else ""
+
+    try:
+        pub_dt = parsedate_to_datetime(pub_raw)
+        published_at = pub_dt.astimezone(timezone.utc).isoformat()
+    except Exception:
+        published_at = datetime.now(timezone.utc).isoformat()
+
+    return NewsItem(
+        id=_make_id(guid),
+        title=title,
+        summary=summary,
+        url=url,
+        source=source,
+        published_at=published_at,
+        symbols=symbols,
+        thumbnail=None,
+    )
 
 
 async def _fetch_feed(url: str, symbols: list[str]) -> list["NewsItem"]:
     try:
-        async with httpx.AsyncClient(timeout=12, headers=COMMON_HEADERS, follow_redirects=True) as client:
-            resp = await client.get(url)
-            if resp.status_code != 200:
-                return []
-        return _parse_rss(resp.text, symbols)
+        resp = await get_rss_client().get(url, headers=COMMON_HEADERS)
+        if resp.status_code != 200:
+            return []
+        return _parse_rss(resp.content, symbols)
     except Exception:
         return []
 
 
 def _merge_dedupe(batches: list[list["NewsItem"]], limit: int) -> list["NewsItem"]:
-    seen: set[str] = set()
-    merged: list[NewsItem] = []
+    # One pass keeping the newest copy of each headline, so only the unique
+    # items need sorting.
+    best: dict[str, NewsItem] = {}
     for batch in batches:
         for item in batch:
             key = item.title.lower()[:60]
-            if key not in seen:
-                seen.add(key)
-                merged.append(item)
-    merged.sort(key=lambda x: x.published_at, reverse=True)
-    return merged[:limit]
+            current = best.get(key)
+            if current is None or item.published_at > current.published_at:
+                best[key] = item
+    return sorted(best.values(), key=lambda x: x.published_at, reverse=True)[:limit]
 
 
 # ── Models ──────────────────────────────────────────────────────────────────────
@@ -197,7 +204,8 @@ async def get_company_news(
     by symbol mention in title. Falls back to Google News for each symbol.
     ?symbols=RELIANCE,TCS,HDFCBANK
     """
-    symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+    # Uppercase + dedupe in one pass (order kept for the Google News fallback)
+    symbol_list = list(dict.fromkeys(m.group(0).upper() for m in _SYMBOL_RE.finditer(symbols)))
     if not symbol_list:
         return []
 
@@ -57,7 +57,7 @@ async def create_portfolio(portfolio: PortfolioCreate, manager=Depends(require_m
     # Verify client belongs to this manager
     client = (
         supabase.table("users")
-        .select("*")
+        .select("id")
         .eq("id", portfolio.client_id)
         .eq("manager_id", manager.id)
         .single()
@@ -122,7 +122,7 @@ async def add_holding(
     if portfolio.data:
         from app.services.alerts import create_alert
 
-        create_alert(
+        await create_alert(
             portfolio.data["client_id"],
             "portfolio_update",
             f"Your fund manager added {holding.symbol} "
@@ -320,7 +320,7 @@ async def add_transaction(
             "sell": "sold",
             "dividend": "recorded a dividend for",
         }.get(transaction.type.value, "recorded")
-        create_alert(
+        await create_alert(
             portfolio.data["client_id"],
             "transaction",
             f"Your fund manager {action} {transaction.quantity} units of "
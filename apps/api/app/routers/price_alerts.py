@@ -102,13 +102,14 @@ async def check_price_alerts(user=Depends(get_current_user)):
     if not active_alerts:
         return {"triggered": 0, "checked": 0}
 
-    # Fetch prices for unique symbols (in thread pool — yfinance is sync)
-    unique_symbols = list({a["symbol"] for a in active_alerts})
-    loop = asyncio.get_event_loop()
-    prices: dict[str, float | None] = {}
-    for sym in unique_symbols:
-        price = await loop.run_in_executor(None, _fetch_price, sym)
-        prices[sym] = price
+    # Fetch prices for unique symbols in parallel (thread pool — yfinance is sync)
+    unique_symbols = list(dict.fromkeys(a["symbol"] for a in active_alerts))
+    loop = asyncio.get_running_loop()
+    price_results = await asyncio.gather(*[
+        loop.run_in_executor(None, _fetch_price, sym)
+        for sym in unique_symbols
+    ])
+    prices: dict[str, float | None] = dict(zip(unique_symbols, price_results))
 
     triggered_count = 0
     now_iso = datetime.now(timezone.utc).isoformat()
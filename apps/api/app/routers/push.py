@@ -2,9 +2,11 @@
 Push notification token management endpoints.
 
 POST /push/register-token   — upsert an Expo push token for the current user
+POST /push/register-tokens  — upsert several tokens (e.g. one per platform) in one call
 DELETE /push/unregister-token — remove a token (e.g. on logout)
 POST /push/test             — send a test push to the current user's registered tokens
 """
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
@@ -14,34 +16,79 @@ from app.services.supabase_client import get_supabase_admin
 
 router = APIRouter()
 
+# ── Recently-registered token cache (24-hour TTL) ─────────────────────────────
+# The app calls /register-token on every launch; skip the upsert when the same
+# token was already registered for this user recently.
+# Keyed by "user_id:token" → platform
+REGISTER_TTL = 86400  # 24 hours
+_registered: TTLCache[str, str] = TTLCache(maxsize=16384, ttl=REGISTER_TTL)
+
+EXPO_TOKEN_PREFIX = "ExponentPushToken["
+
 
 class TokenPayload(BaseModel):
     token: str
     platform: str  # 'ios' | 'android'
 
 
-@router.post("/register-token")
-async def register_token(payload: TokenPayload, user=Depends(get_current_user)):
-    """Upsert a push token for the current user."""
-    if not payload.token.startswith("ExponentPushToken["):
-        raise HTTPException(status_code=400, detail="Invalid Expo push token format")
+class TokensPayload(BaseModel):
+    tokens: list[TokenPayload]
+
+
+def _register_tokens(user_id: str, tokens: list[TokenPayload]) -> int:
+    """Upsert valid, not-recently-registered tokens in a single call. Returns the count."""
+    pending: dict[str, TokenPayload] = {}
+    for t in tokens:
+        if not t.token.startswith(EXPO_TOKEN_PREFIX):
+            continue
+        if _registered.get(f"{user_id}:{t.token}") == t.platform:
+            continue
+        pending[t.token] = t  # one row per token — upsert rejects duplicate conflict keys
+
+    if not pending:
+        return 0
 
     supabase = get_supabase_admin()
     supabase.table("push_tokens").upsert(
-        {
-            "user_id": user.id,
-            "token": payload.token,
-            "platform": payload.platform,
-            "updated_at": "now()",
-        },
+        [
+            {
+                "user_id": user_id,
+                "token": t.token,
+                "platform": t.platform,
+                "updated_at": "now()",
+            }
+            for t in pending.values()
+        ],
         on_conflict="user_id,token",
     ).execute()
+    for t in pending.values():
+        _registered[f"{user_id}:{t.token}"] = t.platform
+    return len(pending)
+
+
+@router.post("/register-token")
+async def register_token(payload: TokenPayload, user=Depends(get_current_user)):
+    """Upsert a push token for the current user."""
+    if not payload.token.startswith(EXPO_TOKEN_PREFIX):
+        raise HTTPException(status_code=400, detail="Invalid Expo push token format")
+    _register_tokens(user.id, [payload])
     return {"status": "ok"}
 
 
+@router.post("/register-tokens")
+async def register_tokens(payload: TokensPayload, user=Depends(get_current_user)):
+    """Upsert several push tokens for the current user in one round-trip.
+
+    Tokens that aren't Expo push tokens are skipped.
+    """
+    registered = _register_tokens(user.id, payload.tokens)
+    return {"status": "ok", "registered": registered}
+
+
 @router.delete("/unregister-token")
 async def unregister_token(payload: TokenPayload, user=Depends(get_current_user)):
     """Remove a push token (call on logout or token rotation)."""
+    _registered.pop(f"{user.id}:{payload.token}", None)
     supabase = get_supabase_admin()
     supabase.table("push_tokens").delete().eq("user_id", user.id).eq(
         "token", payload.token
@@ -57,5 +104,5 @@ async def test_push(user=Depends(get_current_user)):
     tokens = [row["token"] for row in (result.data or [])]
     if not tokens:
         raise HTTPException(status_code=404, detail="No push tokens registered for this user")
-    await send_to_user(user.id, "Test Notification 🎉", "Push notifications are working!")
+    await send_to_user(user.id, "Test Notification 🎉", "Push notifications are working!", tokens=tokens)
     return {"status": "sent", "token_count": len(tokens)}
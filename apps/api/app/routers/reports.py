@@ -1,10 +1,16 @@
 """PDF portfolio report generation using reportlab."""
 import asyncio
+import hashlib
 import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime, timezone
 
-import yfinance as yf
-from fastapi import APIRouter, Depends, HTTPException
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import Response
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics.shapes import Drawing, Rect
@@ -53,21 +59,197 @@ CHART_COLORS = [
     colors.HexColor("#06B6D4"),
 ]
 
+# ── Shared styles (built once, reused by every report) ────────────────────────
+_STYLES = getSampleStyleSheet()
+_BODY_STYLE    = ParagraphStyle("Body", parent=_STYLES["Normal"], textColor=_TEXT, fontSize=9, leading=14)
+_SMALL_STYLE   = ParagraphStyle("Small", parent=_STYLES["Normal"], textColor=_MUTED, fontSize=7.5, leading=11)
+_DISC_STYLE    = ParagraphStyle("Disc", parent=_STYLES["Normal"], textColor=_MUTED, fontSize=7, leading=10)
+_SECTION_STYLE = ParagraphStyle(
+    "SH", parent=_STYLES["Normal"],
+    textColor=_NAVY, fontSize=9,
+    fontName="Helvetica-Bold", letterSpacing=1,
+)
+
+_SECTION_TBL_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, -1), _SECTION),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 10),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
+    ("TOPPADDING",    (0, 0), (-1, -1), 6),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ("LINEAFTER",     (0, 0), (0, 0),  3, _ACCENT),   # thin top border
+    ("LINEABOVE",     (0, 0), (-1, 0), 0.5, _BORDER),
+    ("LINEBELOW",     (0, 0), (-1, 0), 0.5, _BORDER),
+    ("ROUNDEDCORNERS", [4]),
+])
+
+_INFO_TBL_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, -1), _CARD_BG),
+    ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 12),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
+    ("TOPPADDING",    (0, 0), (-1, -1), 10),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 10),
+    ("LINEBEFORE",    (1, 0), (-1, -1), 0.5, _BORDER),
+    ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
+])
+
+_LEGEND_TBL_STYLE = TableStyle([
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+    ("TOPPADDING",    (0, 0), (-1, -1), 5),
+    ("LINEBELOW",     (0, 0), (-1, -2), 0.3, _BORDER),
+    ("TEXTCOLOR",     (1, 0), (1, -1), _TEXT),
+    ("TEXTCOLOR",     (2, 0), (2, -1), _MUTED),
+    ("ALIGN",         (1, 0), (-1, -1), "RIGHT"),
+])
+
+_ALLOC_INNER_STYLE = TableStyle([("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                                 ("LEFTPADDING", (1, 0), (1, 0), 16)])
+
+_ALLOC_CARD_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, -1), _CARD_BG),
+    ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
+    ("TOPPADDING",    (0, 0), (-1, -1), 10),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 10),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 10),
+])
+
+# Static part of the holdings/transactions tables; per-row colours are added
+# with a second setStyle call
+_HOLDINGS_BASE_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, 0), _NAVY),
+    ("TEXTCOLOR",     (0, 0), (-1, 0), _WHITE),
+    ("FONTNAME",      (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("FONTSIZE",      (0, 0), (-1, 0), 8),
+    ("FONTSIZE",      (0, 1), (-1, -1), 8),
+    ("TEXTCOLOR",     (0, 1), (-1, -1), _TEXT),
+    ("ALIGN",         (0, 0), (-1, 0), "CENTER"),
+    ("ALIGN",         (2, 1), (-1, -1), "RIGHT"),
+    ("ALIGN",         (0, 1), (1, -1), "LEFT"),
+    ("TOPPADDING",    (0, 0), (-1, -1), 6),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 8),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
+    ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
+    ("LINEBELOW",     (0, 0), (-1, -1), 0.3, _BORDER),
+])
+
+_TX_BASE_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, 0), _NAVY),
+    ("TEXTCOLOR",     (0, 0), (-1, 0), _WHITE),
+    ("FONTNAME",      (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("FONTSIZE",      (0, 0), (-1, -1), 8),
+    ("ALIGN",         (0, 0), (-1, 0), "CENTER"),
+    ("ALIGN",         (3, 1), (-1, -1), "RIGHT"),
+    ("TOPPADDING",    (0, 0), (-1, -1), 6),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 8),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
+    ("TEXTCOLOR",     (0, 1), (-1, -1), _TEXT),
+    ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
+    ("LINEBELOW",     (0, 0), (-1, -1), 0.3, _BORDER),
+])
+
+_DISC_TBL_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, -1), _SECTION),
+    ("BOX",           (0, 0), (-1, -1), 0.5, _BORDER),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 10),
+    ("TOPPADDING",    (0, 0), (-1, -1), 8),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
+])
+
+
+# ── Live prices ───────────────────────────────────────────────────────────────
+# Quotes come from Yahoo's v8 chart API (no crumb/cookie needed, unlike v7
+# /quote) over one pooled client. Reports generated back-to-back share most
+# symbols, so successful quotes are cached for 90 seconds.
+_YF_CHART_URL = "https://query2.finance.yahoo.com/v8/finance/chart/{}"
+_YF_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+    "Accept": "application/json",
+}
+_price_cache: dict[str, tuple[float, float]] = {}
+PRICE_TTL = 90
+
+_http: httpx.AsyncClient | None = None
+
+
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            headers=_YF_HEADERS,
+            timeout=10,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        )
+    return _http
+
+
+async def close_http_client() -> None:
+    """Close the shared Yahoo client (called on app shutdown)."""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
 
-def _fetch_price(symbol: str) -> float | None:
+async def _fetch_price(client: httpx.AsyncClient, symbol: str) -> float | None:
     # Symbols are stored with exchange suffix already (e.g. RELIANCE.NS, TATASTEEL.BO)
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.fast_info
-        price = getattr(info, "last_price", None)
-        if price:
-            return float(price)
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            return float(hist["Close"].iloc[-1])
+        resp = await client.get(_YF_CHART_URL.format(symbol), params={"interval": "1d", "range": "1d"})
+        if resp.status_code != 200:
+            return None
+        price = resp.json()["chart"]["result"][0]["meta"].get("regularMarketPrice")
+        return float(price) if price else None
     except Exception:
-        pass
-    return None
+        return None
+
+
+async def _fetch_prices(symbols: list[str]) -> dict[str, float]:
+    """Live prices for symbols, served from cache where fresh, the rest fetched concurrently."""
+    now = time.time()
+    prices: dict[str, float] = {}
+    for sym in symbols:
+        entry = _price_cache.get(sym)
+        if entry and (now - entry[0]) < PRICE_TTL:
+            prices[sym] = entry[1]
+    misses = [sym for sym in symbols if sym not in prices]
+    if not misses:
+        return prices
+
+    client = _get_http()
+    results = await asyncio.gather(*[_fetch_price(client, sym) for sym in misses])
+    now = time.time()
+    for sym, price in zip(misses, results):
+        if price is not None:
+            prices[sym] = price
+            _price_cache[sym] = (now, price)
+    return prices
+
+
+# ── PDF worker pool ───────────────────────────────────────────────────────────
+# doc.build() is CPU-bound and holds the GIL; render in separate processes so
+# reports use spare cores and don't tie up the default thread pool. forkserver
+# avoids forking the threaded server process.
+_pdf_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) - 1),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the PDF worker processes (called on app shutdown)."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
 
 
 def _build_pie(labels: list[str], values: list[float], width: float = 180, height: float = 180) -> Drawing:
@@ -90,25 +272,11 @@ def _build_pie(labels: list[str], values: list[float], width: float = 180, heigh
     return d
 
 
-def _section_header(title: str, styles) -> Table:
+def _section_header(title: str) -> Table:
     """Styled section header with left accent bar."""
-    p = Paragraph(f"<b>{title.upper()}</b>", ParagraphStyle(
-        "SH", parent=styles["Normal"],
-        textColor=_NAVY, fontSize=9,
-        fontName="Helvetica-Bold", letterSpacing=1,
-    ))
+    p = Paragraph(f"<b>{title.upper()}</b>", _SECTION_STYLE)
     tbl = Table([[p]], colWidths=[17 * cm])
-    tbl.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, -1), _SECTION),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 10),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
-        ("TOPPADDING",    (0, 0), (-1, -1), 6),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-        ("LINEAFTER",     (0, 0), (0, 0),  3, _ACCENT),   # thin top border
-        ("LINEABOVE",     (0, 0), (-1, 0), 0.5, _BORDER),
-        ("LINEBELOW",     (0, 0), (-1, 0), 0.5, _BORDER),
-        ("ROUNDEDCORNERS", [4]),
-    ]))
+    tbl.setStyle(_SECTION_TBL_STYLE)
     return tbl
 
 
@@ -173,13 +341,9 @@ def _generate_pdf(
                   doc.width, doc.height, id="main")
     doc.addPageTemplates([PageTemplate(id="all", frames=frame, onPage=_header_footer)])
 
-    styles = getSampleStyleSheet()
     story = []
-
-    # ── Styles ────────────────────────────────────────────────────────────────
-    body = ParagraphStyle("Body", parent=styles["Normal"], textColor=_TEXT, fontSize=9, leading=14)
-    label_st = ParagraphStyle("Label", parent=styles["Normal"], textColor=_MUTED, fontSize=8)
-    small = ParagraphStyle("Small", parent=styles["Normal"], textColor=_MUTED, fontSize=7.5, leading=11)
+    body = _BODY_STYLE
+    small = _SMALL_STYLE
 
     report_date = datetime.now(timezone.utc).strftime("%B %d, %Y")
 
@@ -197,25 +361,20 @@ def _generate_pdf(
         ]
     ]
     info_tbl = Table(info_data, colWidths=[4.5*cm, 5*cm, 4*cm, 3.5*cm])
-    info_tbl.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, -1), _CARD_BG),
-        ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 12),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
-        ("TOPPADDING",    (0, 0), (-1, -1), 10),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 10),
-        ("LINEBEFORE",    (1, 0), (-1, -1), 0.5, _BORDER),
-        ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
-    ]))
+    info_tbl.setStyle(_INFO_TBL_STYLE)
     story.append(info_tbl)
     story.append(Spacer(1, 14))
 
-    # ── KPI summary ───────────────────────────────────────────────────────────
-    invested_value = sum(h["quantity"] * h["avg_cost"] for h in holdings)
-    current_value = 0.0
+    # Resolve each holding's price, value and cost basis once; the KPI,
+    # allocation and holdings sections all read from this list
+    enriched: list[tuple[dict, float, float, float]] = []
     for h in holdings:
         lp = live_prices.get(h["symbol"]) or h.get("manual_price") or h["avg_cost"]
-        current_value += h["quantity"] * lp
+        enriched.append((h, lp, h["quantity"] * lp, h["quantity"] * h["avg_cost"]))
+
+    # ── KPI summary ───────────────────────────────────────────────────────────
+    invested_value = sum(cost for _, _, _, cost in enriched)
+    current_value = sum((val for _, _, val, _ in enriched), 0.0)
 
     returns = current_value - invested_value
     returns_pct = (returns / invested_value * 100) if invested_value else 0.0
@@ -247,7 +406,7 @@ def _generate_pdf(
         ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
         ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
     ]))
-    story.append(_section_header("Portfolio Summary", styles))
+    story.append(_section_header("Portfolio Summary"))
     story.append(Spacer(1, 6))
     story.append(kpi_tbl)
     story.append(Spacer(1, 16))
@@ -255,10 +414,9 @@ def _generate_pdf(
     # ── Asset Allocation ──────────────────────────────────────────────────────
     if holdings:
         type_values: dict[str, float] = {}
-        for h in holdings:
-            lp = live_prices.get(h["symbol"]) or h.get("manual_price") or h["avg_cost"]
+        for h, _, val, _ in enriched:
             t = h.get("asset_type", "other").replace("_", " ").title()
-            type_values[t] = type_values.get(t, 0) + h["quantity"] * lp
+            type_values[t] = type_values.get(t, 0) + val
 
         total_cv = sum(type_values.values()) or 1
         labels = list(type_values.keys())
@@ -279,28 +437,14 @@ def _generate_pdf(
             ])
 
         legend_tbl = Table(legend_rows, colWidths=[3.8*cm, 1.4*cm, 3.3*cm])
-        legend_tbl.setStyle(TableStyle([
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
-            ("TOPPADDING",    (0, 0), (-1, -1), 5),
-            ("LINEBELOW",     (0, 0), (-1, -2), 0.3, _BORDER),
-            ("TEXTCOLOR",     (1, 0), (1, -1), _TEXT),
-            ("TEXTCOLOR",     (2, 0), (2, -1), _MUTED),
-            ("ALIGN",         (1, 0), (-1, -1), "RIGHT"),
-        ]))
+        legend_tbl.setStyle(_LEGEND_TBL_STYLE)
 
         # Wrap pie + legend in a card
         alloc_inner = Table([[pie_drawing, legend_tbl]], colWidths=[8*cm, 9*cm])
-        alloc_inner.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                                          ("LEFTPADDING", (1, 0), (1, 0), 16)]))
+        alloc_inner.setStyle(_ALLOC_INNER_STYLE)
         alloc_card = Table([[alloc_inner]], colWidths=[17*cm])
-        alloc_card.setStyle(TableStyle([
-            ("BACKGROUND",    (0, 0), (-1, -1), _CARD_BG),
-            ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
-            ("TOPPADDING",    (0, 0), (-1, -1), 10),
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 10),
-            ("LEFTPADDING",   (0, 0), (-1, -1), 10),
-        ]))
-        story.append(_section_header("Asset Allocation", styles))
+        alloc_card.setStyle(_ALLOC_CARD_STYLE)
+        story.append(_section_header("Asset Allocation"))
         story.append(Spacer(1, 6))
         story.append(alloc_card)
         story.append(Spacer(1, 16))
@@ -310,11 +454,9 @@ def _generate_pdf(
         h_headers = ["Symbol", "Type", "Qty", "Avg Cost", "Cur. Price", "Value", "P&L"]
         h_rows = [h_headers]
         h_pl_signs = []
-        for h in holdings:
+        for h, lp, val, cost in enriched:
             sym = h["symbol"]
-            lp  = live_prices.get(sym) or h.get("manual_price") or h["avg_cost"]
-            val = h["quantity"] * lp
-            pl  = val - h["quantity"] * h["avg_cost"]
+            pl  = val - cost
             h_pl_signs.append(pl >= 0)
             h_rows.append([
                 sym.replace(".NS", "").replace(".BO", ""),
@@ -328,30 +470,15 @@ def _generate_pdf(
 
         col_w = [3.0, 2.4, 1.6, 2.6, 2.6, 2.6, 2.2]
         h_tbl = Table(h_rows, colWidths=[w*cm for w in col_w])
-        h_style = [
-            ("BACKGROUND",    (0, 0), (-1, 0), _NAVY),
-            ("TEXTCOLOR",     (0, 0), (-1, 0), _WHITE),
-            ("FONTNAME",      (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE",      (0, 0), (-1, 0), 8),
-            ("FONTSIZE",      (0, 1), (-1, -1), 8),
-            ("TEXTCOLOR",     (0, 1), (-1, -1), _TEXT),
-            ("ALIGN",         (0, 0), (-1, 0), "CENTER"),
-            ("ALIGN",         (2, 1), (-1, -1), "RIGHT"),
-            ("ALIGN",         (0, 1), (1, -1), "LEFT"),
-            ("TOPPADDING",    (0, 0), (-1, -1), 6),
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ("LEFTPADDING",   (0, 0), (-1, -1), 8),
-            ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
-            ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
-            ("LINEBELOW",     (0, 0), (-1, -1), 0.3, _BORDER),
-        ]
+        h_style = []
         for i, (row_idx, is_gain) in enumerate(zip(range(1, len(holdings)+1), h_pl_signs)):
             bg = _CARD_BG if i % 2 == 0 else _ROW_ALT
             h_style.append(("BACKGROUND", (0, row_idx), (-1, row_idx), bg))
             h_style.append(("TEXTCOLOR",  (6, row_idx), (6, row_idx), _GREEN if is_gain else _RED))
             h_style.append(("FONTNAME",   (6, row_idx), (6, row_idx), "Helvetica-Bold"))
+        h_tbl.setStyle(_HOLDINGS_BASE_STYLE)
         h_tbl.setStyle(TableStyle(h_style))
-        story.append(_section_header("Holdings", styles))
+        story.append(_section_header("Holdings"))
         story.append(Spacer(1, 6))
         story.append(h_tbl)
         story.append(Spacer(1, 16))
@@ -374,29 +501,16 @@ def _generate_pdf(
             ])
 
         tx_tbl = Table(tx_rows, colWidths=[2.6*cm, 3.2*cm, 2*cm, 1.8*cm, 3.7*cm, 3.7*cm])
-        tx_style = [
-            ("BACKGROUND",    (0, 0), (-1, 0), _NAVY),
-            ("TEXTCOLOR",     (0, 0), (-1, 0), _WHITE),
-            ("FONTNAME",      (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE",      (0, 0), (-1, -1), 8),
-            ("ALIGN",         (0, 0), (-1, 0), "CENTER"),
-            ("ALIGN",         (3, 1), (-1, -1), "RIGHT"),
-            ("TOPPADDING",    (0, 0), (-1, -1), 6),
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ("LEFTPADDING",   (0, 0), (-1, -1), 8),
-            ("RIGHTPADDING",  (0, 0), (-1, -1), 8),
-            ("TEXTCOLOR",     (0, 1), (-1, -1), _TEXT),
-            ("BOX",           (0, 0), (-1, -1), 0.8, _BORDER),
-            ("LINEBELOW",     (0, 0), (-1, -1), 0.3, _BORDER),
-        ]
+        tx_style = []
         for i, (row_idx, tx_type) in enumerate(zip(range(1, len(tx_types)+1), tx_types)):
             bg = _CARD_BG if i % 2 == 0 else _ROW_ALT
             tx_style.append(("BACKGROUND", (0, row_idx), (-1, row_idx), bg))
             col = tx_color_map.get(tx_type, _TEXT)
             tx_style.append(("TEXTCOLOR",  (2, row_idx), (2, row_idx), col))
             tx_style.append(("FONTNAME",   (2, row_idx), (2, row_idx), "Helvetica-Bold"))
+        tx_tbl.setStyle(_TX_BASE_STYLE)
         tx_tbl.setStyle(TableStyle(tx_style))
-        story.append(_section_header("Recent Transactions", styles))
+        story.append(_section_header("Recent Transactions"))
         story.append(Spacer(1, 6))
         story.append(tx_tbl)
 
@@ -406,99 +520,108 @@ def _generate_pdf(
         "This report is generated for informational purposes only. "
         "Past performance is not indicative of future results. "
         "All prices are indicative and sourced from public data feeds.",
-        ParagraphStyle("Disc", parent=styles["Normal"], textColor=_MUTED, fontSize=7, leading=10),
+        _DISC_STYLE,
     )]], colWidths=[17*cm])
-    disc.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, -1), _SECTION),
-        ("BOX",           (0, 0), (-1, -1), 0.5, _BORDER),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 10),
-        ("TOPPADDING",    (0, 0), (-1, -1), 8),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
-    ]))
+    disc.setStyle(_DISC_TBL_STYLE)
     story.append(disc)
 
     doc.build(story)
     return buf.getvalue()
 
 
+def _report_etag(manager_name: str, client: dict, holdings: list[dict], transactions: list[dict]) -> str:
+    """Fingerprint of the report inputs, bucketed to the minute so live prices refresh."""
+    minute_bucket = int(time.time() // 60)
+    payload = json.dumps(
+        [manager_name, client, holdings, transactions, minute_bucket],
+        sort_keys=True,
+        default=str,
+    )
+    return f'"{hashlib.sha256(payload.encode()).hexdigest()[:16]}"'
+
+
 @router.get("/portfolio/{client_id}")
-async def get_portfolio_report(client_id: str, manager=Depends(require_manager)):
+async def get_portfolio_report(
+    client_id: str,
+    request: Request,
+    manager=Depends(require_manager),
+):
     """Generate and return a PDF portfolio report for a client."""
     supabase = get_supabase_admin()
 
-    # Verify client belongs to this manager
-    try:
-        client_result = (
-            supabase.table("users")
+    # Client (ownership check), manager name and portfolio ids are independent —
+    # run the three queries concurrently (supabase-py is sync, so in threads)
+    client_result, mgr_result, portfolios_result = await asyncio.gather(
+        asyncio.to_thread(
+            lambda: supabase.table("users")
             .select("*")
             .eq("id", client_id)
             .eq("manager_id", manager.id)
             .single()
             .execute()
-        )
-    except Exception:
-        raise HTTPException(status_code=404, detail="Client not found or not assigned to you")
-    if not client_result.data:
+        ),
+        asyncio.to_thread(
+            lambda: supabase.table("users").select("full_name").eq("id", manager.id).single().execute()
+        ),
+        asyncio.to_thread(
+            lambda: supabase.table("portfolios").select("id").eq("client_id", client_id).execute()
+        ),
+        return_exceptions=True,
+    )
+
+    # Verify client belongs to this manager
+    if isinstance(client_result, BaseException) or not client_result.data:
         raise HTTPException(status_code=404, detail="Client not found or not assigned to you")
     client = client_result.data
 
-    # Fetch manager name
-    try:
-        mgr_result = (
-            supabase.table("users").select("full_name").eq("id", manager.id).single().execute()
-        )
-        manager_name = mgr_result.data.get("full_name", "Manager") if mgr_result.data else "Manager"
-    except Exception:
+    if isinstance(mgr_result, BaseException) or not mgr_result.data:
         manager_name = "Manager"
+    else:
+        manager_name = mgr_result.data.get("full_name", "Manager")
 
-    # Fetch portfolios
-    portfolios_result = (
-        supabase.table("portfolios").select("id").eq("client_id", client_id).execute()
-    )
+    if isinstance(portfolios_result, BaseException):
+        raise portfolios_result
     portfolio_ids = [p["id"] for p in (portfolios_result.data or [])]
     if not portfolio_ids:
         raise HTTPException(status_code=404, detail="No portfolios found for this client")
 
-    # Fetch holdings from first/only portfolio
-    holdings_result = (
-        supabase.table("holdings")
-        .select("*")
-        .in_("portfolio_id", portfolio_ids)
-        .execute()
+    # Holdings and the most recent 10 transactions, concurrently
+    holdings_result, transactions_result = await asyncio.gather(
+        asyncio.to_thread(
+            lambda: supabase.table("holdings")
+            .select("*")
+            .in_("portfolio_id", portfolio_ids)
+            .execute()
+        ),
+        asyncio.to_thread(
+            lambda: supabase.table("transactions")
+            .select("*")
+            .in_("portfolio_id", portfolio_ids)
+            .order("date", desc=True)
+            .limit(10)
+            .execute()
+        ),
     )
     holdings = holdings_result.data or []
-
-    # Fetch transactions (most recent 10)
-    transactions_result = (
-        supabase.table("transactions")
-        .select("*")
-        .in_("portfolio_id", portfolio_ids)
-        .order("date", desc=True)
-        .limit(10)
-        .execute()
-    )
     transactions = transactions_result.data or []
 
-    # Fetch live prices for stock/ETF holdings in parallel
-    tradeable_symbols = list({
+    # Same data within the same minute → the client's copy is still current;
+    # skip the price fetch and PDF build entirely
+    etag = _report_etag(manager_name, client, holdings, transactions)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Fetch live prices for stock/ETF holdings
+    tradeable_symbols = list(dict.fromkeys(
         h["symbol"] for h in holdings
         if h.get("asset_type") in ("stock", "etf")
-    })
+    ))
+    live_prices = await _fetch_prices(tradeable_symbols)
+
+    # Generate PDF in the worker process pool (reportlab is sync and CPU-bound)
     loop = asyncio.get_running_loop()
-    price_tasks = [
-        loop.run_in_executor(None, _fetch_price, sym)
-        for sym in tradeable_symbols
-    ]
-    price_results = await asyncio.gather(*price_tasks)
-    live_prices: dict[str, float] = {
-        sym: price
-        for sym, price in zip(tradeable_symbols, price_results)
-        if price is not None
-    }
-
-    # Generate PDF in thread pool (reportlab is sync)
     pdf_bytes = await loop.run_in_executor(
-        None,
+        _get_pdf_pool(),
         _generate_pdf,
         manager_name,
         client,
@@ -513,5 +636,8 @@ async def get_portfolio_report(client_id: str, manager=Depends(require_manager))
     return Response(
         content=pdf_bytes,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "ETag": etag,
+        },
     )
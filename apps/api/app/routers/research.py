@@ -1,14 +1,19 @@
 import asyncio
+import json
 import time
 from typing import Any
 
+import anthropic
 import httpx
+import orjson
 import yfinance as yf
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 
 from app.config import settings
 from app.dependencies import get_current_user
+from app.services.single_flight import cached_fetch
 
 router = APIRouter()
 
@@ -18,23 +23,53 @@ YAHOO_FINANCE_API_BASE = "https://yh-finance.p.rapidapi.com"
 # ============================================================
 # In-memory cache to avoid duplicate API calls
 # TTL = 5 minutes — same stock won't hit the API again within 5 min
+# Bounded so distinct search queries can't grow it without limit
 # ============================================================
 
-_cache: dict[str, tuple[float, dict]] = {}
 CACHE_TTL = 300  # 5 minutes
+_cache: TTLCache[str, dict] = TTLCache(maxsize=2048, ttl=CACHE_TTL)
 
 
-def _cache_get(key: str) -> dict | None:
-    entry = _cache.get(key)
-    if entry and (time.time() - entry[0]) < CACHE_TTL:
-        return entry[1]
-    if entry:
-        del _cache[key]
-    return None
 
 
-def _cache_set(key: str, data: dict) -> None:
-    _cache[key] = (time.time(), data)
+# ============================================================
+# Shared HTTP clients — keep connections to RapidAPI and Anthropic alive
+# across requests instead of a fresh TLS handshake per call
+# ============================================================
+
+_http: httpx.AsyncClient | None = None
+
+
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            base_url=YAHOO_FINANCE_API_BASE,
+            timeout=15,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        )
+    return _http
+
+
+_anthropic: anthropic.AsyncAnthropic | None = None
+
+
+def _get_anthropic() -> anthropic.AsyncAnthropic:
+    global _anthropic
+    if _anthropic is None:
+        _anthropic = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
+    return _anthropic
+
+
+async def close_http_client() -> None:
+    """Close the shared RapidAPI and Anthropic clients (called on app shutdown)."""
+    global _http, _anthropic
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    if _anthropic is not None:
+        await _anthropic.close()
+        _anthropic = None
 
 
 # ============================================================
@@ -112,22 +147,18 @@ async def _yahoo_finance_get(endpoint: str, params: dict | None = None) -> dict:
             "Yahoo Finance API not configured. Set INDIAN_API_KEY in .env",
         )
 
-    cache_key = f"{endpoint}:{params}"
-    cached = _cache_get(cache_key)
-    if cached is not None:
-        return cached
+    cache_key = f"{endpoint}:{json.dumps(params, sort_keys=True)}"
+    # Concurrent misses for the same key share one upstream call
+    return await cached_fetch(_cache, cache_key, lambda: _yahoo_finance_fetch(endpoint, params))
+
 
+async def _yahoo_finance_fetch(endpoint: str, params: dict | None) -> dict:
     headers = {
         "x-rapidapi-host": "yh-finance.p.rapidapi.com",
         "x-rapidapi-key": settings.indian_api_key,
     }
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.get(
-            f"{YAHOO_FINANCE_API_BASE}{endpoint}",
-            params=params,
-            headers=headers,
-        )
+    resp = await _get_http().get(endpoint, params=params, headers=headers)
     if resp.status_code == 429:
         raise HTTPException(
             429,
@@ -136,9 +167,7 @@ async def _yahoo_finance_get(endpoint: str, params: dict | None = None) -> dict:
     if resp.status_code != 200:
         raise HTTPException(502, f"Stock data provider error ({resp.status_code}): {resp.text}")
 
-    data = resp.json()
-    _cache_set(cache_key, data)
-    return data
+    return orjson.loads(resp.content)
 
 
 # ============================================================
@@ -186,12 +215,15 @@ async def search_stocks(
 
 def _fmt_large_inr(val: Any) -> str:
     """Format large INR values in crores."""
-    if val is None or val == "N/A":
+    if isinstance(val, (int, float)):
+        v = float(val)
+    elif val is None or val == "N/A":
         return "N/A"
-    try:
-        v = float(str(val).replace(",", "").replace("₹", ""))
-    except (ValueError, TypeError):
-        return str(val)
+    else:
+        try:
+            v = float(str(val).replace(",", "").replace("₹", ""))
+        except (ValueError, TypeError):
+            return str(val)
     cr = v / 1e7
     if cr >= 100000:
         return f"₹{cr / 100000:.2f}L Cr"
@@ -203,6 +235,9 @@ def _fmt_large_inr(val: Any) -> str:
 
 
 def _safe_float(val: Any, default: float = 0) -> float:
+    # Yahoo JSON values are usually numeric already; skip the string cleanup
+    if isinstance(val, (int, float)):
+        return float(val)
     if val is None or val == "N/A" or val == "":
         return default
     try:
@@ -340,31 +375,20 @@ async def get_fundamentals(symbol: str, region: str = "IN", user=Depends(get_cur
 # POST /research/analyze
 # ============================================================
 
-
-@router.post("/analyze")
-async def analyze_stock(body: AnalyzeRequest, user=Depends(get_current_user)):
-    if not settings.anthropic_api_key:
-        raise HTTPException(
-            503,
-            "AI analysis not configured. Set ANTHROPIC_API_KEY in .env",
-        )
-
-    import anthropic
-
-    f = body.fundamentals
-    prompt = f"""You are a financial analyst assistant. Analyze this stock and provide a concise investment analysis.
-
-**{body.symbol}** — {f.get('name', 'Unknown')}
-- Sector: {f.get('sector')}
-- Price: {f.get('price')} ({f.get('change')})
-- Market Cap: {f.get('marketCap')}
-- P/E: {f.get('pe')} | Forward P/E: {f.get('forwardPe')}
-- EPS: {f.get('eps')}
-- Revenue: {f.get('revenue')} (Growth: {f.get('revenueGrowth')})
-- Gross Margin: {f.get('grossMargin')} | Operating: {f.get('operatingMargin')} | Net: {f.get('netMargin')}
-- ROE: {f.get('roe')} | D/E: {f.get('debtToEquity')} | Current Ratio: {f.get('currentRatio')}
-- Beta: {f.get('beta')} | Dividend Yield: {f.get('dividendYield')}
-- 52W Range: {f.get('fiftyTwoLow')} - {f.get('fiftyTwoHigh')}
+# Parsed once at import; filled per request with format_map()
+_ANALYZE_PROMPT = """You are a financial analyst assistant. Analyze this stock and provide a concise investment analysis.
+
+**{symbol}** — {name}
+- Sector: {sector}
+- Price: {price} ({change})
+- Market Cap: {marketCap}
+- P/E: {pe} | Forward P/E: {forwardPe}
+- EPS: {eps}
+- Revenue: {revenue} (Growth: {revenueGrowth})
+- Gross Margin: {grossMargin} | Operating: {operatingMargin} | Net: {netMargin}
+- ROE: {roe} | D/E: {debtToEquity} | Current Ratio: {currentRatio}
+- Beta: {beta} | Dividend Yield: {dividendYield}
+- 52W Range: {fiftyTwoLow} - {fiftyTwoHigh}
 
 Respond in this exact JSON format (no markdown, just raw JSON):
 {{
@@ -382,23 +406,39 @@ Respond in this exact JSON format (no markdown, just raw JSON):
 
 Ensure keyMetrics has exactly 4 items. Use status "good" for healthy metrics, "warning" for concerning ones, and "neutral" for average ones."""
 
-    client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
-    message = await asyncio.to_thread(
-        lambda: client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}],
+
+class _PromptFields(dict):
+    """Fundamentals mapping that renders missing fields as None, like f.get()."""
+
+    def __missing__(self, key: str) -> None:
+        return None
+
+
+@router.post("/analyze")
+async def analyze_stock(body: AnalyzeRequest, user=Depends(get_current_user)):
+    if not settings.anthropic_api_key:
+        raise HTTPException(
+            503,
+            "AI analysis not configured. Set ANTHROPIC_API_KEY in .env",
         )
+
+    f = body.fundamentals
+    prompt = _ANALYZE_PROMPT.format_map(
+        _PromptFields(f, symbol=body.symbol, name=f.get("name", "Unknown"))
     )
 
-    import json
+    message = await _get_anthropic().messages.create(
+        model="claude-haiku-4-5-20251001",
+        max_tokens=1024,
+        messages=[{"role": "user", "content": prompt}],
+    )
 
     try:
         text = message.content[0].text.strip()
         if text.startswith("```"):
             text = text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        analysis = json.loads(text)
-    except (json.JSONDecodeError, IndexError):
+        analysis = orjson.loads(text)
+    except (orjson.JSONDecodeError, IndexError):
         analysis = {
             "analystRating": "Hold",
             "priceTarget": f.get("price", "N/A"),
@@ -1,17 +1,27 @@
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException
 
 from app.dependencies import get_current_user, require_manager
 from app.models.user import UserResponse, UserProfileUpdate, ClientNotesUpdate
-from app.services.supabase_client import get_supabase_admin
+from app.services.supabase_client import get_supabase_admin_async
 
 router = APIRouter()
 
+# GET /me is fetched on nearly every screen; keep each profile briefly.
+# Per-process, so other workers may serve a stale row for up to the TTL.
+PROFILE_TTL = 30
+_profile_cache: TTLCache[str, dict] = TTLCache(maxsize=4096, ttl=PROFILE_TTL)
+
 
 @router.get("/me", response_model=UserResponse)
 async def get_my_profile(user=Depends(get_current_user)):
     """Get the current user's profile."""
-    supabase = get_supabase_admin()
-    result = (
+    cached = _profile_cache.get(str(user.id))
+    if cached is not None:
+        return cached
+
+    supabase = await get_supabase_admin_async()
+    result = await (
         supabase.table("users")
         .select("*")
         .eq("id", user.id)
@@ -20,6 +30,7 @@ async def get_my_profile(user=Depends(get_current_user)):
     )
     if not result.data:
         raise HTTPException(status_code=404, detail="Profile not found")
+    _profile_cache[str(user.id)] = result.data
     return result.data
 
 
@@ -29,11 +40,11 @@ async def update_my_profile(
     user=Depends(get_current_user),
 ):
     """Update the current user's profile."""
-    supabase = get_supabase_admin()
-    payload = {k: v for k, v in updates.model_dump().items() if v is not None}
+    supabase = await get_supabase_admin_async()
+    payload = updates.model_dump(exclude_none=True)
     if not payload:
         raise HTTPException(status_code=400, detail="No fields to update")
-    result = (
+    result = await (
         supabase.table("users")
         .update(payload)
         .eq("id", user.id)
@@ -41,14 +52,15 @@ async def update_my_profile(
         .single()
         .execute()
     )
+    _profile_cache.pop(str(user.id), None)
     return result.data
 
 
 @router.get("/clients", response_model=list[UserResponse])
 async def get_clients(manager=Depends(require_manager)):
     """Get all clients managed by the current manager."""
-    supabase = get_supabase_admin()
-    result = (
+    supabase = await get_supabase_admin_async()
+    result = await (
         supabase.table("users")
         .select("*")
         .eq("manager_id", manager.id)
@@ -65,11 +77,11 @@ async def create_client(
     manager=Depends(require_manager),
 ):
     """Manager creates a new client account."""
-    supabase = get_supabase_admin()
+    supabase = await get_supabase_admin_async()
 
     # Create auth user
     try:
-        auth_result = supabase.auth.admin.create_user(
+        auth_result = await supabase.auth.admin.create_user(
             {
                 "email": email,
                 "password": password,
@@ -80,19 +92,16 @@ async def create_client(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Set the manager_id on the public.users row
-    supabase.table("users").update({"manager_id": manager.id}).eq(
-        "id", auth_result.user.id
-    ).execute()
-
-    result = (
+    # Set the manager_id on the public.users row; the update returns the row
+    result = await (
         supabase.table("users")
-        .select("*")
+        .update({"manager_id": manager.id})
         .eq("id", auth_result.user.id)
-        .single()
         .execute()
     )
-    return result.data
+    if not result.data:
+        raise HTTPException(status_code=500, detail="Failed to link client to manager")
+    return result.data[0]
 
 
 @router.patch("/clients/{client_id}/notes", response_model=UserResponse)
@@ -102,11 +111,11 @@ async def update_client_notes(
     manager=Depends(require_manager),
 ):
     """Manager updates private notes about one of their clients."""
-    supabase = get_supabase_admin()
+    supabase = await get_supabase_admin_async()
 
     # Verify client belongs to this manager
     try:
-        client = (
+        client = await (
             supabase.table("users")
             .select("id")
             .eq("id", client_id)
@@ -119,21 +128,21 @@ async def update_client_notes(
     if not client.data:
         raise HTTPException(status_code=404, detail="Client not found or not assigned to you")
 
-    supabase.table("users").update({"notes": body.notes}).eq("id", client_id).execute()
-    result = supabase.table("users").select("*").eq("id", client_id).single().execute()
-    return result.data
+    result = await supabase.table("users").update({"notes": body.notes}).eq("id", client_id).execute()
+    _profile_cache.pop(client_id, None)
+    return result.data[0]
 
 
 @router.delete("/clients/{client_id}")
 async def unlink_client(client_id: str, manager=Depends(require_manager)):
     """Manager unlinks a client (sets manager_id to null)."""
-    supabase = get_supabase_admin()
+    supabase = await get_supabase_admin_async()
 
     # Verify client belongs to this manager
     try:
-        client = (
+        client = await (
             supabase.table("users")
-            .select("*")
+            .select("id")
             .eq("id", client_id)
             .eq("manager_id", manager.id)
             .single()
@@ -145,6 +154,7 @@ async def unlink_client(client_id: str, manager=Depends(require_manager)):
         raise HTTPException(status_code=404, detail="Client not found or not assigned to you")
 
     # Unlink by setting manager_id to null
-    supabase.table("users").update({"manager_id": None}).eq("id", client_id).execute()
+    await supabase.table("users").update({"manager_id": None}).eq("id", client_id).execute()
+    _profile_cache.pop(client_id, None)
 
     return {"success": True, "message": "Client unlinked successfully"}
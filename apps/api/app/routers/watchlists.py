@@ -1,11 +1,18 @@
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
 from app.dependencies import get_current_user
-from app.services.supabase_client import get_supabase_admin
+from app.responses import ORJSONResponse
+from app.services.supabase_client import get_supabase_admin_async
 
 router = APIRouter()
 
+# GET /watchlists is fetched on every watchlist screen; keep each user's lists
+# briefly. Per-process, so other workers may lag a write by up to the TTL.
+LISTS_TTL = 30
+_lists_cache: TTLCache[str, list] = TTLCache(maxsize=4096, ttl=LISTS_TTL)
+
 
 class WatchlistCreate(BaseModel):
     name: str
@@ -20,10 +27,13 @@ class WatchlistItemAdd(BaseModel):
     name: str = ""
 
 
-def _fetch_items(watchlist_id: str) -> list:
-    result = (
-        get_supabase_admin()
-        .table("watchlist_items")
+class WatchlistItemsBulkAdd(BaseModel):
+    items: list[WatchlistItemAdd]
+
+
+async def _fetch_items(supabase, watchlist_id: str) -> list:
+    result = await (
+        supabase.table("watchlist_items")
         .select("*")
         .eq("watchlist_id", watchlist_id)
         .order("added_at")
@@ -41,56 +51,39 @@ def _format(w: dict, items: list | None = None) -> dict:
     }
 
 
-def _assert_owner(watchlist_id: str, user_id: str):
-    result = (
-        get_supabase_admin()
-        .table("watchlists")
-        .select("id")
-        .eq("id", watchlist_id)
-        .eq("user_id", user_id)
-        .single()
-        .execute()
-    )
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Watchlist not found")
-
-
-@router.get("")
+@router.get("", response_class=ORJSONResponse)
 async def list_watchlists(user=Depends(get_current_user)):
-    supabase = get_supabase_admin()
-    lists = (
+    cached = _lists_cache.get(str(user.id))
+    if cached is not None:
+        return cached
+
+    supabase = await get_supabase_admin_async()
+    # Items come back embedded, so this is one round-trip however many lists
+    result = await (
         supabase.table("watchlists")
-        .select("*")
+        .select("*, watchlist_items(*)")
         .eq("user_id", str(user.id))
         .order("created_at")
+        .order("added_at", foreign_table="watchlist_items")
         .execute()
-    ).data or []
-
-    items_all = (
-        supabase.table("watchlist_items")
-        .select("*")
-        .in_("watchlist_id", [w["id"] for w in lists] if lists else ["none"])
-        .order("added_at")
-        .execute()
-    ).data or []
-
-    items_by_list: dict[str, list] = {}
-    for item in items_all:
-        items_by_list.setdefault(item["watchlist_id"], []).append(item)
+    )
 
-    return [_format(w, items_by_list.get(w["id"], [])) for w in lists]
+    formatted = [_format(w, w.get("watchlist_items") or []) for w in result.data or []]
+    _lists_cache[str(user.id)] = formatted
+    return formatted
 
 
 @router.post("", status_code=201)
 async def create_watchlist(body: WatchlistCreate, user=Depends(get_current_user)):
-    supabase = get_supabase_admin()
-    result = (
+    supabase = await get_supabase_admin_async()
+    result = await (
         supabase.table("watchlists")
         .insert({"user_id": str(user.id), "name": body.name})
         .execute()
     )
     if not result.data:
         raise HTTPException(status_code=500, detail="Failed to create watchlist")
+    _lists_cache.pop(str(user.id), None)
     return _format(result.data[0])
 
 
@@ -100,22 +93,36 @@ async def rename_watchlist(
     body: WatchlistRename,
     user=Depends(get_current_user),
 ):
-    _assert_owner(watchlist_id, str(user.id))
-    supabase = get_supabase_admin()
-    result = (
+    supabase = await get_supabase_admin_async()
+    # The user_id filter authorizes and updates in one statement
+    result = await (
         supabase.table("watchlists")
         .update({"name": body.name})
         .eq("id", watchlist_id)
+        .eq("user_id", str(user.id))
         .execute()
     )
-    items = _fetch_items(watchlist_id)
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+    _lists_cache.pop(str(user.id), None)
+    items = await _fetch_items(supabase, watchlist_id)
     return _format(result.data[0], items)
 
 
 @router.delete("/{watchlist_id}", status_code=204)
 async def delete_watchlist(watchlist_id: str, user=Depends(get_current_user)):
-    _assert_owner(watchlist_id, str(user.id))
-    get_supabase_admin().table("watchlists").delete().eq("id", watchlist_id).execute()
+    supabase = await get_supabase_admin_async()
+    # Filtering on user_id makes the delete its own ownership check
+    result = await (
+        supabase.table("watchlists")
+        .delete()
+        .eq("id", watchlist_id)
+        .eq("user_id", str(user.id))
+        .execute()
+    )
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+    _lists_cache.pop(str(user.id), None)
 
 
 @router.post("/{watchlist_id}/items", status_code=201)
@@ -124,16 +131,48 @@ async def add_item(
     body: WatchlistItemAdd,
     user=Depends(get_current_user),
 ):
-    _assert_owner(watchlist_id, str(user.id))
-    result = (
-        get_supabase_admin()
-        .table("watchlist_items")
-        .upsert(
-            {"watchlist_id": watchlist_id, "symbol": body.symbol, "name": body.name},
-            on_conflict="watchlist_id,symbol",
-        )
-        .execute()
-    )
+    supabase = await get_supabase_admin_async()
+    # Ownership check and upsert run together in the database
+    result = await supabase.rpc(
+        "add_watchlist_item",
+        {
+            "p_user_id": str(user.id),
+            "p_watchlist_id": watchlist_id,
+            "p_symbol": body.symbol,
+            "p_name": body.name,
+        },
+    ).execute()
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+    _lists_cache.pop(str(user.id), None)
+    return result.data
+
+
+@router.post("/{watchlist_id}/items/bulk", status_code=201)
+async def add_items_bulk(
+    watchlist_id: str,
+    body: WatchlistItemsBulkAdd,
+    user=Depends(get_current_user),
+):
+    """Add many symbols in one ownership check and one multi-row upsert."""
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No items to add")
+    # One row per symbol (last one wins): Postgres rejects an upsert that
+    # touches the same row twice
+    items = {i.symbol: {"symbol": i.symbol, "name": i.name} for i in body.items}
+
+    supabase = await get_supabase_admin_async()
+    result = await supabase.rpc(
+        "add_watchlist_items",
+        {
+            "p_user_id": str(user.id),
+            "p_watchlist_id": watchlist_id,
+            "p_items": list(items.values()),
+        },
+    ).execute()
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+    _lists_cache.pop(str(user.id), None)
     return result.data
 
 
@@ -143,12 +182,12 @@ async def remove_item(
     symbol: str,
     user=Depends(get_current_user),
 ):
-    _assert_owner(watchlist_id, str(user.id))
-    (
-        get_supabase_admin()
-        .table("watchlist_items")
-        .delete()
-        .eq("watchlist_id", watchlist_id)
-        .eq("symbol", symbol)
-        .execute()
-    )
+    supabase = await get_supabase_admin_async()
+    # Ownership check and delete run together in the database
+    owned = await supabase.rpc(
+        "remove_watchlist_item",
+        {"p_user_id": str(user.id), "p_watchlist_id": watchlist_id, "p_symbol": symbol},
+    ).execute()
+    if not owned.data:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+    _lists_cache.pop(str(user.id), None)
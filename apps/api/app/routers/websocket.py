@@ -2,45 +2,121 @@
 WebSocket endpoint for real-time market price streaming.
 Clients connect via wss://<host>/ws/prices?token=<jwt>
 """
+import asyncio
+import base64
 import hashlib
-import json
 import logging
+import random
+import re
 import time
+from functools import lru_cache
+from typing import Any
 
 import httpx
+import orjson
+from cachetools import TLRUCache, TTLCache
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 from pydantic import BaseModel
 
+from app.config import settings
 from app.dependencies import get_current_user, require_manager
+from app.services.http_clients import get_kite_client
 from app.services.kite_service import kite_service
+from app.services.single_flight import cached_fetch
+from app.services.supabase_client import get_supabase_admin
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["websocket"])
 
-# ── Simple in-process cache for Kite quotes (30-second TTL) ──────────────────
-_kite_quote_cache: dict[str, tuple[float, object]] = {}
+# ── In-process cache for Kite REST responses ─────────────────────────────────
+# Bounded, with each entry's TTL jittered ±10% so symbols cached together
+# don't all expire in the same tick. Concurrent misses for one key share a
+# single upstream call via cached_fetch.
+QUOTE_TTL = 30
+OHLC_TTL = 300
 
-def _kite_cache_get(key: str, ttl: int):
-    if key in _kite_quote_cache:
-        ts, data = _kite_quote_cache[key]
-        if time.time() - ts < ttl:
-            return data
-    return None
 
-def _kite_cache_set(key: str, data: object):
-    _kite_quote_cache[key] = (time.time(), data)
+def _jittered_ttu(ttl: float):
+    return lambda _key, _value, now: now + ttl * random.uniform(0.9, 1.1)
+
+
+_quote_cache: TLRUCache[frozenset[str], dict] = TLRUCache(maxsize=4096, ttu=_jittered_ttu(QUOTE_TTL))
+_ohlc_cache: TLRUCache[str, list | dict] = TLRUCache(maxsize=1024, ttu=_jittered_ttu(OHLC_TTL))
+
+
+_YF_SUFFIX_RE = re.compile(r"\.(NS|BO)$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=8192)
+def _clean(sym: str) -> str:
+    """Strip Yahoo Finance exchange suffixes (.NS, .BO) that don't belong in Kite symbols.
+
+    e.g. "NSE:RELIANCE.NS" → "NSE:RELIANCE". Cached: the same few tickers
+    come back on every poll.
+    """
+    i = sym.find(":")
+    if i < 0:
+        return sym
+    return sym[: i + 1] + _YF_SUFFIX_RE.sub("", sym[i + 1 :])
+
+
+# ── Validated WebSocket tokens ───────────────────────────────────────────────
+# Reconnect storms would otherwise hit Supabase Auth once per socket. Entries
+# are keyed by a digest (the raw JWT never sits in memory as a key) and never
+# outlive the token's own exp claim.
+JWT_CACHE_TTL = 300
+_jwt_cache: TTLCache[bytes, tuple[Any, float]] = TTLCache(maxsize=2048, ttl=JWT_CACHE_TTL)
+
+
+def _jwt_exp(token: str) -> float:
+    """Unverified `exp` claim of a JWT, or 0 if it can't be read."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(orjson.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return 0.0
+
+
+async def _verify_ws_token(token: str):
+    """Resolve a Supabase JWT to its user, or None if Supabase rejects it."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    entry = _jwt_cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    supabase = get_supabase_admin()
+    # The sync client blocks on HTTP; keep it off the event loop
+    result = await asyncio.to_thread(supabase.auth.get_user, token)
+    user = result.user if result else None
+    if user is not None:
+        exp = _jwt_exp(token)
+        if exp > time.time():
+            _jwt_cache[key] = (user, exp)
+    return user
+
+
+# Upstream Kite subscribes from one client are coalesced over this window, so
+# a screen that subscribes ticker-by-ticker costs one ticker.subscribe() call
+SUBSCRIBE_DEBOUNCE = 0.05
+
+# Upper bound on symbols per /kite/quotes call or per subscribe message
+MAX_SYMBOLS = 500
 
 
 # ─── WebSocket Endpoint ───────────────────────────────────────────────────────
 
 @router.websocket("/ws/prices")
-async def prices_ws(websocket: WebSocket, token: str = ""):
+async def prices_ws(websocket: WebSocket, token: str = "", batch: bool = False):
     """
     Real-time price streaming WebSocket.
 
     Query param:  ?token=<supabase_jwt>
+                  &batch=1 to receive {"type": "tick_batch", "ticks": [...]}
+                  frames (one per upstream Kite message) instead of one
+                  "tick" frame per symbol
     First message: {"action": "subscribe", "symbols": ["NSE:RELIANCE", "NSE:TCS"]}
     Subsequent:    {"action": "subscribe"|"unsubscribe", "symbols": [...]}
     """
@@ -50,10 +126,7 @@ async def prices_ws(websocket: WebSocket, token: str = ""):
         return
 
     try:
-        from app.services.supabase_client import get_supabase_admin
-        supabase = get_supabase_admin()
-        result = supabase.auth.get_user(token)
-        if not result or not result.user:
+        if await _verify_ws_token(token) is None:
             await websocket.close(code=4001, reason="Invalid token")
             return
     except Exception as exc:
@@ -63,22 +136,36 @@ async def prices_ws(websocket: WebSocket, token: str = ""):
 
     # ── Accept and register ───────────────────────────────────────────────────
     await websocket.accept()
-    await kite_service.manager.connect(websocket)
+    await kite_service.manager.connect(websocket, batch=batch)
     logger.info("WebSocket client connected")
 
     # Send current connection status immediately
     connected = kite_service._connected
     source = kite_service._source
-    await websocket.send_text(
-        json.dumps({"type": "status", "connected": connected, "source": source})
+    # Text frames: the mobile client JSON.parse()s event.data as a string.
+    # Queued rather than sent directly so the client's sender task stays the
+    # only writer on the socket.
+    await kite_service.manager.send_to(
+        websocket,
+        orjson.dumps({"type": "status", "connected": connected, "source": source}).decode(),
     )
 
+    pending: set[str] = set()
+    flush_task: asyncio.Task | None = None
+
+    async def _flush_pending():
+        await asyncio.sleep(SUBSCRIBE_DEBOUNCE)
+        batch = list(pending)
+        pending.clear()
+        if batch:
+            await kite_service.subscribe_symbols(batch)
+
     try:
         while True:
             raw = await websocket.receive_text()
             try:
-                msg = json.loads(raw)
-            except json.JSONDecodeError:
+                msg = orjson.loads(raw)
+            except orjson.JSONDecodeError:
                 continue
 
             action = msg.get("action")
@@ -86,22 +173,38 @@ async def prices_ws(websocket: WebSocket, token: str = ""):
 
             if not symbols:
                 continue
+            if len(symbols) > MAX_SYMBOLS:
+                logger.warning("Ignoring %s of %d symbols (max %d)", action, len(symbols), MAX_SYMBOLS)
+                continue
 
             if action == "subscribe":
-                await kite_service.manager.subscribe(websocket, symbols)
-                await kite_service.subscribe_symbols(symbols)
-                logger.debug("Client subscribed to: %s", symbols)
+                new = await kite_service.manager.subscribe(websocket, symbols)
+                if new:
+                    pending.update(new)
+                    if flush_task is None or flush_task.done():
+                        flush_task = asyncio.create_task(_flush_pending())
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Client subscribed to %d symbols", len(symbols))
 
             elif action == "unsubscribe":
                 await kite_service.manager.unsubscribe(websocket, symbols)
-                logger.debug("Client unsubscribed from: %s", symbols)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Client unsubscribed from %d symbols", len(symbols))
 
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected")
     except Exception as exc:
         logger.error("WebSocket error: %s", exc)
     finally:
+        if flush_task is not None and not flush_task.done():
+            flush_task.cancel()
         await kite_service.manager.disconnect(websocket)
+        # This client's unflushed symbols die with it, except any another
+        # client subscribed to in the meantime (its subscribe saw them as
+        # already watched and left the upstream subscribe to this flush)
+        orphaned = [s for s in pending if kite_service.manager.is_watched(s)]
+        if orphaned:
+            await kite_service.subscribe_symbols(orphaned)
 
 
 # ─── Token Management REST Endpoints ─────────────────────────────────────────
@@ -116,7 +219,7 @@ async def kite_status(manager=Depends(require_manager)):
     return {
         "connected": kite_service._connected,
         "source": kite_service._source,
-        "subscribed_symbols": len(kite_service.manager.all_subscribed_symbols()),
+        "subscribed_symbols": kite_service.manager.unique_symbol_count,
         "instruments_loaded": kite_service.instruments._loaded,
     }
 
@@ -153,36 +256,24 @@ async def get_kite_quotes(
     symbol_list = [s.strip() for s in symbols.split(",") if s.strip()]
     if not symbol_list:
         return {}
+    if len(symbol_list) > MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"Too many symbols; max {MAX_SYMBOLS}")
 
-    # Strip Yahoo Finance exchange suffixes (.NS, .BO) that don't belong in Kite symbols.
-    # e.g. "NSE:RELIANCE.NS" → "NSE:RELIANCE"
-    def _clean(sym: str) -> str:
-        if ":" in sym:
-            exchange, ticker = sym.split(":", 1)
-            if ticker.upper().endswith((".NS", ".BO")):
-                ticker = ticker.rsplit(".", 1)[0]
-            return f"{exchange}:{ticker}"
-        return sym
+    # Order-insensitive key without sorting; Kite doesn't care about param order
+    clean_set = frozenset(_clean(s) for s in symbol_list)
 
-    clean_list = sorted([_clean(s) for s in symbol_list])  # sort for consistent cache key
+    # 30-second TTL — frequent enough for near-real-time, low enough to avoid Kite rate limits
+    return await cached_fetch(_quote_cache, clean_set, lambda: _fetch_quotes(clean_set))
 
-    # Check cache — 30-second TTL (frequent enough for near-real-time, low enough to avoid Kite rate limits)
-    cache_key = ",".join(clean_list)
-    cached = _kite_cache_get(cache_key, ttl=30)
-    if cached is not None:
-        return cached
 
-    params = [("i", s) for s in clean_list]
+async def _fetch_quotes(clean_set: frozenset[str]) -> dict:
+    params = [("i", s) for s in clean_set]
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(
-                "https://api.kite.trade/quote",
-                params=params,
-                headers={
-                    "Authorization": f"token {kite_service._api_key}:{kite_service._access_token}",
-                    "X-Kite-Version": "3",
-                },
-            )
+        resp = await get_kite_client().get(
+            "/quote",
+            params=params,
+            headers=kite_service._rest_headers,
+        )
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Kite API request timed out")
     except Exception as e:
@@ -194,16 +285,14 @@ async def get_kite_quotes(
             detail=f"Kite quote API error: {resp.status_code}",
         )
 
-    data = resp.json().get("data", {})
-    result = {
+    data = orjson.loads(resp.content).get("data", {})
+    return {
         sym: {
             "ltp": quote.get("last_price", 0),
             "close": quote.get("ohlc", {}).get("close", 0),
         }
         for sym, quote in data.items()
     }
-    _kite_cache_set(cache_key, result)
-    return result
 
 
 @router.get("/kite/ohlc/{symbol}")
@@ -212,6 +301,7 @@ async def get_kite_ohlc(
     interval: str = "day",
     from_date: str = "",
     to_date: str = "",
+    columnar: bool = False,
     user=Depends(get_current_user),
 ):
     """
@@ -220,8 +310,11 @@ async def get_kite_ohlc(
     - symbol: NSE ticker without exchange prefix (e.g. "RELIANCE")
     - interval: "day" | "week" | "month" | "5minute" etc.
     - from_date / to_date: YYYY-MM-DD
+    - columnar: return one array per field instead of one object per candle
+      (much smaller and cheaper to encode for long intraday ranges)
 
     Returns: [{date, open, high, low, close, volume}, ...]
+             or {date: [...], open: [...], ..., volume: [...]} when columnar
     Cache: 5 minutes
     """
     if not kite_service._access_token or not kite_service._api_key:
@@ -232,11 +325,15 @@ async def get_kite_ohlc(
     if token is None:
         raise HTTPException(status_code=404, detail=f"Symbol {symbol} not found in Kite instruments")
 
-    cache_key = f"ohlc:{token}:{interval}:{from_date}:{to_date}"
-    cached = _kite_cache_get(cache_key, ttl=300)
-    if cached is not None:
-        return cached
+    cache_key = f"{token}:{interval}:{from_date}:{to_date}:{int(columnar)}"
+    return await cached_fetch(
+        _ohlc_cache, cache_key, lambda: _fetch_ohlc(token, interval, from_date, to_date, columnar)
+    )
+
 
+async def _fetch_ohlc(
+    token: int, interval: str, from_date: str, to_date: str, columnar: bool
+) -> list | dict:
     params = {
         "from": f"{from_date} 09:00:00",
         "to": f"{to_date} 15:30:00",
@@ -245,15 +342,12 @@ async def get_kite_ohlc(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.get(
-                f"https://api.kite.trade/instruments/historical/{token}/{interval}",
-                params=params,
-                headers={
-                    "Authorization": f"token {kite_service._api_key}:{kite_service._access_token}",
-                    "X-Kite-Version": "3",
-                },
-            )
+        resp = await get_kite_client().get(
+            f"/instruments/historical/{token}/{interval}",
+            params=params,
+            headers=kite_service._rest_headers,
+            timeout=15,
+        )
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Kite API request timed out")
     except Exception as e:
@@ -265,8 +359,18 @@ async def get_kite_ohlc(
             detail=f"Kite historical API error {resp.status_code}: {resp.text[:200]}",
         )
 
-    candles = resp.json().get("data", {}).get("candles", [])
-    result = [
+    candles = orjson.loads(resp.content).get("data", {}).get("candles", [])
+    if columnar:
+        rows = [c for c in candles if len(c) >= 6]
+        return {
+            "date": [c[0][:10] for c in rows],
+            "open": [c[1] for c in rows],
+            "high": [c[2] for c in rows],
+            "low": [c[3] for c in rows],
+            "close": [c[4] for c in rows],
+            "volume": [c[5] for c in rows],
+        }
+    return [
         {
             "date": c[0][:10],
             "open": c[1],
@@ -279,9 +383,6 @@ async def get_kite_ohlc(
         if len(c) >= 6
     ]
 
-    _kite_cache_set(cache_key, result)
-    return result
-
 
 @router.get("/auth/kite/login")
 async def kite_login():
@@ -289,11 +390,9 @@ async def kite_login():
     Redirects the browser to Zerodha's OAuth login page.
     After login, Zerodha calls back to /auth/kite/callback automatically.
     """
-    from app.config import settings as _s
-    from fastapi.responses import RedirectResponse
-    if not _s.kite_api_key:
+    if not settings.kite_api_key:
         return HTMLResponse("<h2>Error: KITE_API_KEY not configured in Railway</h2>", status_code=500)
-    login_url = f"https://kite.trade/connect/login?api_key={_s.kite_api_key}&v=3"
+    login_url = f"https://kite.trade/connect/login?api_key={settings.kite_api_key}&v=3"
     return RedirectResponse(login_url)
 
 
@@ -304,25 +403,27 @@ async def kite_callback(request_token: str = ""):
     for an access_token, refreshes the live Kite service, and shows the token
     so it can be copied into Railway environment variables.
     """
-    from app.config import settings as _s
     if not request_token:
         return HTMLResponse("<h2>Error: no request_token in URL</h2>", status_code=400)
 
-    api_key = _s.kite_api_key
-    api_secret = _s.kite_api_secret
+    api_key = settings.kite_api_key
+    api_secret = settings.kite_api_secret
     if not api_key or not api_secret:
         return HTMLResponse("<h2>Error: KITE_API_KEY / KITE_API_SECRET not configured</h2>", status_code=500)
 
-    # Checksum = SHA256(api_key + request_token + api_secret)
-    checksum = hashlib.sha256(f"{api_key}{request_token}{api_secret}".encode()).hexdigest()
+    # Checksum = SHA256(api_key + request_token + api_secret), fed piecewise
+    # rather than through a concatenated string
+    h = hashlib.sha256(api_key.encode())
+    h.update(request_token.encode())
+    h.update(api_secret.encode())
+    checksum = h.hexdigest()
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(
-                "https://api.kite.trade/session/token",
-                data={"api_key": api_key, "request_token": request_token, "checksum": checksum},
-                headers={"X-Kite-Version": "3"},
-            )
+        resp = await get_kite_client().post(
+            "/session/token",
+            data={"api_key": api_key, "request_token": request_token, "checksum": checksum},
+            headers={"X-Kite-Version": "3"},
+        )
         if resp.status_code != 200:
             return HTMLResponse(f"<h2>Kite error {resp.status_code}</h2><pre>{resp.text}</pre>", status_code=502)
         access_token = resp.json()["data"]["access_token"]
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 
-from app.services.supabase_client import get_supabase_admin
+from app.services.supabase_client import get_supabase_admin_async
 
 logger = logging.getLogger(__name__)
 
@@ -12,36 +12,41 @@ _ALERT_TITLES: dict[str, str] = {
     "report": "Report Ready 📄",
 }
 
+# Strong refs so in-flight pushes aren't garbage-collected mid-send
+_push_tasks: set[asyncio.Task] = set()
 
-def create_alert(user_id: str, alert_type: str, message: str) -> dict:
+
+async def create_alert(user_id: str, alert_type: str, message: str) -> dict:
     """Create an alert/notification for a user and fire a push notification."""
-    supabase = get_supabase_admin()
-    result = (
-        supabase.table("alerts")
-        .insert({
-            "user_id": user_id,
-            "type": alert_type,
-            "message": message,
-        })
-        .execute()
-    )
-    alert = result.data[0] if result.data else {}
-
-    # Fire push notification asynchronously (best-effort)
-    title = _ALERT_TITLES.get(alert_type, "PortfolioAI")
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # We're inside an async context — schedule without blocking
-            loop.create_task(_send_push_for_alert(user_id, title, message))
-        else:
-            loop.run_until_complete(_send_push_for_alert(user_id, title, message))
-    except Exception as exc:
-        logger.warning("[alerts] Could not schedule push for user %s: %s", user_id, exc)
+    alerts = await create_alerts_bulk([
+        {"user_id": user_id, "type": alert_type, "message": message},
+    ])
+    return alerts[0] if alerts else {}
+
+
+async def create_alerts_bulk(rows: list[dict]) -> list[dict]:
+    """Insert several alerts in one request and push each of them.
 
-    return alert
+    Each row needs "user_id", "type" and "message".
+    """
+    if not rows:
+        return []
+    supabase = await get_supabase_admin_async()
+    result = await supabase.table("alerts").insert(rows).execute()
+
+    # Fire push notifications in the background (best-effort)
+    for row in rows:
+        title = _ALERT_TITLES.get(row["type"], "PortfolioAI")
+        task = asyncio.create_task(_send_push_for_alert(row["user_id"], title, row["message"]))
+        _push_tasks.add(task)
+        task.add_done_callback(_push_tasks.discard)
+
+    return result.data or []
 
 
 async def _send_push_for_alert(user_id: str, title: str, body: str) -> None:
     from app.services.push_service import send_to_user
-    await send_to_user(user_id, title, body)
+    try:
+        await send_to_user(user_id, title, body)
+    except Exception as exc:
+        logger.warning("[alerts] Push failed for user %s: %s", user_id, exc)
@@ -1,6 +1,6 @@
 """
 Email service for sending transactional emails (invite links, etc.)
-Uses smtplib with STARTTLS — works with Gmail App Passwords, Mailgun SMTP, etc.
+Uses aiosmtplib with STARTTLS — works with Gmail App Passwords, Mailgun SMTP, etc.
 
 Required env vars:
     SMTP_HOST      e.g. smtp.gmail.com
@@ -10,43 +10,30 @@ Required env vars:
     SMTP_FROM      display name + address, e.g. "PortfolioAI <noreply@yourapp.com>"
 """
 
-import smtplib
 import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-from app.config import settings
+from email.message import EmailMessage
+from string import Template
 
+import aiosmtplib
 
-def send_invite_email(
-    to_email: str,
-    to_name: str,
-    manager_name: str,
-    invite_url: str,
-) -> bool:
-    """
-    Send a client invite email with the acceptance link.
-    Returns True on success, False if SMTP is not configured or sending fails.
-    """
-    if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password, settings.smtp_from]):
-        print("SMTP not configured — skipping invite email")
-        return False
+from app.config import settings
 
-    subject = f"You've been invited to PortfolioAI by {manager_name}"
+_SSL_CONTEXT = ssl.create_default_context()
 
-    html_body = f"""
+# Compiled once at import; each send only substitutes the three fields
+_INVITE_HTML = Template("""
 <!DOCTYPE html>
 <html>
 <body style="font-family: Arial, sans-serif; background: #f5f5f5; padding: 24px;">
   <div style="max-width: 480px; margin: 0 auto; background: #fff; border-radius: 12px; padding: 32px;">
     <h2 style="color: #1a1a1a; margin-top: 0;">Welcome to PortfolioAI</h2>
-    <p style="color: #555;">Hi {to_name},</p>
+    <p style="color: #555;">Hi ${to_name},</p>
     <p style="color: #555;">
-      <strong>{manager_name}</strong> has invited you to join PortfolioAI to track
+      <strong>${manager_name}</strong> has invited you to join PortfolioAI to track
       and manage your investments together.
     </p>
     <p style="color: #555;">Click the button below to accept your invite and set up your account.</p>
-    <a href="{invite_url}"
+    <a href="${invite_url}"
        style="display: inline-block; margin-top: 16px; padding: 12px 28px;
               background: #4F8CFF; color: #fff; text-decoration: none;
               border-radius: 8px; font-weight: 600; font-size: 15px;">
@@ -56,26 +43,62 @@ def send_invite_email(
       This invite expires in 7 days. If you did not expect this invitation, you can ignore this email.
     </p>
     <p style="color: #bbb; font-size: 11px; margin-top: 8px;">
-      Or copy this link: {invite_url}
+      Or copy this link: ${invite_url}
     </p>
   </div>
 </body>
 </html>
-"""
+""")
+
+_INVITE_TEXT = Template("""\
+Hi ${to_name},
+
+${manager_name} has invited you to join PortfolioAI to track and manage your investments together.
+
+Accept your invite and set up your account here:
+${invite_url}
+
+This invite expires in 7 days. If you did not expect this invitation, you can ignore this email.
+""")
+
+
+async def send_invite_email(
+    to_email: str,
+    to_name: str,
+    manager_name: str,
+    invite_url: str,
+) -> bool:
+    """
+    Send a client invite email with the acceptance link.
+    Returns True on success, False if SMTP is not configured or sending fails.
+    """
+    if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password, settings.smtp_from]):
+        print("SMTP not configured — skipping invite email")
+        return False
+
+    subject = f"You've been invited to PortfolioAI by {manager_name}"
+    fields = {"to_name": to_name, "manager_name": manager_name, "invite_url": invite_url}
 
     try:
-        msg = MIMEMultipart("alternative")
+        msg = EmailMessage()
         msg["Subject"] = subject
         msg["From"] = settings.smtp_from
         msg["To"] = f"{to_name} <{to_email}>"
-        msg.attach(MIMEText(html_body, "html"))
-
-        context = ssl.create_default_context()
-        with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=10) as server:
-            server.ehlo()
-            server.starttls(context=context)
-            server.login(settings.smtp_user, settings.smtp_password)
-            server.sendmail(settings.smtp_from, to_email, msg.as_string())
+        msg.set_content(_INVITE_TEXT.substitute(fields))
+        msg.add_alternative(_INVITE_HTML.substitute(fields), subtype="html")
+
+        await aiosmtplib.send(
+            msg,
+            sender=settings.smtp_from,
+            recipients=[to_email],
+            hostname=settings.smtp_host,
+            port=settings.smtp_port,
+            username=settings.smtp_user,
+            password=settings.smtp_password,
+            start_tls=True,
+            tls_context=_SSL_CONTEXT,
+            timeout=10,
+        )
 
         print(f"Invite email sent to {to_email}")
         return True
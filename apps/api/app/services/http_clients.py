@@ -0,0 +1,76 @@
+"""
+Shared outbound HTTP clients.
+
+One pooled httpx.AsyncClient per upstream keeps connections (and their TLS
+sessions) alive across requests instead of a fresh handshake per call.
+Clients are created lazily on first use and closed on app shutdown.
+"""
+import httpx
+
+KITE_API_BASE = "https://api.kite.trade"
+
+_kite_client: httpx.AsyncClient | None = None
+_expo_client: httpx.AsyncClient | None = None
+_rapidapi_client: httpx.AsyncClient | None = None
+_rss_client: httpx.AsyncClient | None = None
+
+
+def get_kite_client() -> httpx.AsyncClient:
+    """Client for the Kite Connect REST API (relative URLs, e.g. "/quote")."""
+    global _kite_client
+    if _kite_client is None:
+        # HTTP/2 lets concurrent /quote and /historical calls share one
+        # connection instead of opening more
+        _kite_client = httpx.AsyncClient(
+            base_url=KITE_API_BASE,
+            http2=True,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        )
+    return _kite_client
+
+
+def get_expo_client() -> httpx.AsyncClient:
+    """Client for the Expo push API."""
+    global _expo_client
+    if _expo_client is None:
+        _expo_client = httpx.AsyncClient(
+            http2=True,
+            timeout=15,
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+        )
+    return _expo_client
+
+
+def get_rapidapi_client() -> httpx.AsyncClient:
+    """Client for RapidAPI-hosted market data (the Yahoo Finance price fallback)."""
+    global _rapidapi_client
+    if _rapidapi_client is None:
+        _rapidapi_client = httpx.AsyncClient(
+            http2=True,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+        )
+    return _rapidapi_client
+
+
+def get_rss_client() -> httpx.AsyncClient:
+    """Client for publisher RSS feeds (news router and scheduler jobs)."""
+    global _rss_client
+    if _rss_client is None:
+        _rss_client = httpx.AsyncClient(
+            http2=True,
+            timeout=12,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        )
+    return _rss_client
+
+
+async def close_http_clients() -> None:
+    """Close the shared clients (called on app shutdown)."""
+    global _kite_client, _expo_client, _rapidapi_client, _rss_client
+    for client in (_kite_client, _expo_client, _rapidapi_client, _rss_client):
+        if client is not None:
+            await client.aclose()
+    _kite_client = _expo_client = _rapidapi_client = _rss_client = None
@@ -5,21 +5,29 @@ Falls back to 5-second Yahoo Finance polling when Kite is unavailable.
 """
 import asyncio
 import csv
-import io
-import json
 import logging
+import sys
 import time
 import threading
+from collections.abc import Iterable
 from typing import Any
 
-import httpx
+import orjson
+from cachetools import LRUCache
 from fastapi import WebSocket
 
+from app.config import settings
+from app.services.http_clients import get_kite_client, get_rapidapi_client
+
 logger = logging.getLogger(__name__)
 
 
 # ─── Instrument Cache ────────────────────────────────────────────────────────
 
+# Instrument CSV lines handed to csv.reader at a time while streaming
+CSV_BATCH_LINES = 4096
+
+
 class InstrumentCache:
     """Maps exchange:symbol ↔ Zerodha instrument_token."""
 
@@ -27,37 +35,65 @@ class InstrumentCache:
         self._symbol_to_token: dict[str, int] = {}   # "NSE:RELIANCE" → 738561
         self._token_to_symbol: dict[int, str] = {}   # 738561 → "NSE:RELIANCE"
         self._loaded = False
+        # Clients tend to (re)subscribe the same watchlists; remember them
+        # (also called from the KiteTicker thread, hence the lock)
+        self._tokens_cache: LRUCache[frozenset[str], list[int]] = LRUCache(maxsize=1024)
+        self._tokens_lock = threading.Lock()
 
     async def load(self):
         """Download instrument CSVs from Zerodha and build lookup tables."""
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                for exchange in ("NSE", "BSE"):
-                    resp = await client.get(
-                        f"https://api.kite.trade/instruments/{exchange}"
-                    )
-                    if resp.status_code != 200:
-                        logger.warning("Could not fetch %s instruments: %s", exchange, resp.status_code)
-                        continue
-
-                    reader = csv.DictReader(io.StringIO(resp.text))
-                    for row in reader:
-                        try:
-                            token = int(row["instrument_token"])
-                            tradingsymbol = row["tradingsymbol"]
-                            key = f"{exchange}:{tradingsymbol}"
-                            self._symbol_to_token[key] = token
-                            self._token_to_symbol[token] = key
-                        except (KeyError, ValueError):
-                            continue
-
+            # Both exchanges come from the same host; fetch them concurrently
+            await asyncio.gather(*(self._load_exchange(ex) for ex in ("NSE", "BSE")))
             self._loaded = True
+            with self._tokens_lock:
+                self._tokens_cache.clear()
             logger.info(
                 "Instrument cache loaded: %d symbols", len(self._symbol_to_token)
             )
         except Exception as exc:
             logger.error("Failed to load instrument cache: %s", exc)
 
+    async def _load_exchange(self, exchange: str):
+        # Streamed: rows are indexed as they arrive instead of after the whole
+        # multi-MB file has been buffered and decoded into one string
+        async with get_kite_client().stream("GET", f"/instruments/{exchange}", timeout=30) as resp:
+            if resp.status_code != 200:
+                logger.warning("Could not fetch %s instruments: %s", exchange, resp.status_code)
+                return
+
+            lines = resp.aiter_lines()
+            # Plain rows indexed by header position; DictReader would build a
+            # dict per instrument for the two columns we keep
+            header = next(csv.reader([await anext(lines, "")]), [])
+            try:
+                tok_i = header.index("instrument_token")
+                sym_i = header.index("tradingsymbol")
+            except ValueError:
+                logger.warning("Unexpected %s instruments header: %s", exchange, header[:5])
+                return
+
+            prefix = f"{exchange}:"
+            batch: list[str] = []
+            async for line in lines:
+                batch.append(line)
+                if len(batch) >= CSV_BATCH_LINES:
+                    self._index_rows(csv.reader(batch), prefix, tok_i, sym_i)
+                    batch.clear()
+            self._index_rows(csv.reader(batch), prefix, tok_i, sym_i)
+
+    def _index_rows(self, rows, prefix: str, tok_i: int, sym_i: int):
+        for row in rows:
+            try:
+                token = int(row[tok_i])
+                # Interned: one string object per symbol, shared by both maps
+                # and by ConnectionManager, which interns subscribed names too
+                key = sys.intern(prefix + row[sym_i])
+            except (IndexError, ValueError):
+                continue
+            self._symbol_to_token[key] = token
+            self._token_to_symbol[token] = key
+
     def token(self, symbol: str) -> int | None:
         """Return instrument_token for 'NSE:RELIANCE' style symbol."""
         return self._symbol_to_token.get(symbol)
@@ -68,115 +104,256 @@ class InstrumentCache:
 
     def tokens_for(self, symbols: list[str]) -> list[int]:
         """Convert a list of symbols to instrument tokens, skipping unknowns."""
+        key = frozenset(symbols)
+        with self._tokens_lock:
+            cached = self._tokens_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
         result = []
-        for s in symbols:
+        for s in key:
             t = self.token(s)
             if t is not None:
                 result.append(t)
             else:
                 logger.warning("No instrument token for symbol: %s", s)
-        return result
+        if self._loaded:
+            with self._tokens_lock:
+                self._tokens_cache[key] = result
+        return list(result)
 
 
 # ─── Connection Manager ───────────────────────────────────────────────────────
 
+# Per-frame send deadline; a client that can't take a frame in time is dropped
+SEND_TIMEOUT = 2.0
+# Frames buffered per client; a client this far behind is dropped
+SEND_QUEUE_SIZE = 256
+# Close code for clients dropped as too slow ("try again later"), so the
+# app's reconnect logic kicks in instead of it sitting on a silent socket
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
 class ConnectionManager:
     """Tracks WebSocket clients and their subscribed symbols, fans out ticks."""
 
     def __init__(self):
         self._client_symbols: dict[int, set[str]] = {}   # ws_id → {symbols}
-        self._symbol_clients: dict[str, set[int]] = {}   # symbol → {ws_ids}
+        # symbol → {ws_ids}. Copy-on-write at both levels: writers (under
+        # _lock) build a new dict and swap it in, values are frozensets. Readers
+        # — broadcasts, and the KiteTicker thread via all_subscribed_symbols —
+        # take no lock and never see a dict mid-update.
+        self._symbol_clients: dict[str, frozenset[int]] = {}
         self._clients: dict[int, WebSocket] = {}          # ws_id → WebSocket
+        self._queues: dict[int, asyncio.Queue[str]] = {}  # ws_id → outbound frames
+        self._senders: dict[int, asyncio.Task] = {}       # ws_id → _drain task
+        self._batching: set[int] = set()                  # ws_ids taking tick_batch frames
+        self._closers: set[asyncio.Task] = set()          # pending _close() tasks
         self._lock = asyncio.Lock()
 
     def _ws_id(self, ws: WebSocket) -> int:
         return id(ws)
 
-    async def connect(self, ws: WebSocket):
+    async def connect(self, ws: WebSocket, batch: bool = False):
+        """Register a client. With ``batch``, the ticks from one Kite message
+        arrive as a single {"type": "tick_batch", "ticks": [...]} frame."""
         async with self._lock:
             wid = self._ws_id(ws)
             self._clients[wid] = ws
+            if batch:
+                self._batching.add(wid)
             self._client_symbols[wid] = set()
+            queue: asyncio.Queue[str] = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+            self._queues[wid] = queue
+            self._senders[wid] = asyncio.create_task(self._drain(wid, ws, queue))
+
+    async def _drain(self, wid: int, ws: WebSocket, queue: "asyncio.Queue[str]"):
+        """Per-client sender: writes queued frames in order, so a slow socket
+        only ever backs up its own queue."""
+        try:
+            while True:
+                text = await queue.get()
+                await asyncio.wait_for(ws.send_text(text), timeout=SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            async with self._lock:
+                self._drop_client(wid)
+            await self._close(ws)
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        """Close a dropped client's socket so its read loop ends and the app
+        reconnects. Best effort: the socket may already be gone."""
+        try:
+            await asyncio.wait_for(ws.close(code=CLOSE_TRY_AGAIN_LATER), timeout=SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def _drop_client(self, wid: int):
+        """Forget a client and any symbols left with no subscribers. Hold _lock."""
+        symbols = self._client_symbols.pop(wid, set())
+        if symbols:
+            symbol_clients = dict(self._symbol_clients)
+            for symbol in symbols:
+                self._release(symbol_clients, symbol, wid)
+            self._symbol_clients = symbol_clients
+        self._clients.pop(wid, None)
+        self._batching.discard(wid)
+        self._queues.pop(wid, None)
+        sender = self._senders.pop(wid, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+
+    @staticmethod
+    def _release(symbol_clients: dict[str, frozenset[int]], symbol: str, wid: int):
+        clients = symbol_clients.get(symbol)
+        if clients is not None and wid in clients:
+            remaining = clients - {wid}
+            if remaining:
+                symbol_clients[symbol] = remaining
+            else:
+                del symbol_clients[symbol]
 
     async def disconnect(self, ws: WebSocket):
         async with self._lock:
-            wid = self._ws_id(ws)
-            for symbol in self._client_symbols.get(wid, set()):
-                self._symbol_clients.get(symbol, set()).discard(wid)
-            self._client_symbols.pop(wid, None)
-            self._clients.pop(wid, None)
+            self._drop_client(self._ws_id(ws))
 
-    async def subscribe(self, ws: WebSocket, symbols: list[str]):
+    async def subscribe(self, ws: WebSocket, symbols: list[str]) -> list[str]:
+        """Register symbols for a client; returns those nobody was watching yet."""
+        new: list[str] = []
         async with self._lock:
             wid = self._ws_id(ws)
-            for symbol in symbols:
+            if wid not in self._clients:
+                # Already dropped; its socket is being closed
+                return new
+            symbol_clients = dict(self._symbol_clients)
+            for symbol in map(sys.intern, symbols):
                 self._client_symbols.setdefault(wid, set()).add(symbol)
-                self._symbol_clients.setdefault(symbol, set()).add(wid)
+                clients = symbol_clients.get(symbol)
+                if clients is None:
+                    new.append(symbol)
+                    symbol_clients[symbol] = frozenset((wid,))
+                elif wid not in clients:
+                    symbol_clients[symbol] = clients | {wid}
+            self._symbol_clients = symbol_clients
+        return new
 
     async def unsubscribe(self, ws: WebSocket, symbols: list[str]):
         async with self._lock:
             wid = self._ws_id(ws)
+            if wid not in self._clients:
+                return
+            symbol_clients = dict(self._symbol_clients)
             for symbol in symbols:
                 self._client_symbols.get(wid, set()).discard(symbol)
-                self._symbol_clients.get(symbol, set()).discard(wid)
+                self._release(symbol_clients, symbol, wid)
+            self._symbol_clients = symbol_clients
 
     def all_subscribed_symbols(self) -> set[str]:
-        result: set[str] = set()
-        for syms in self._client_symbols.values():
-            result |= syms
-        return result
+        # _symbol_clients only holds symbols with at least one subscriber.
+        # Safe from the ticker thread: the dict read here is never mutated.
+        return set(self._symbol_clients)
 
-    async def broadcast_tick(self, symbol: str, tick: dict):
-        """Send tick JSON to all clients subscribed to this symbol."""
-        wids = list(self._symbol_clients.get(symbol, set()))
-        payload = json.dumps(tick)
+    def is_watched(self, symbol: str) -> bool:
+        """Whether any client is subscribed to symbol. Safe from the ticker thread."""
+        return symbol in self._symbol_clients
+
+    @property
+    def unique_symbol_count(self) -> int:
+        return len(self._symbol_clients)
+
+    async def _fan_out(self, wids: Iterable[int], text: str):
+        """Queue one frame for many clients; drop any whose queue is full.
+
+        The same str object goes into every queue, so the frame is never
+        copied per client. Dropped clients get their socket closed.
+        """
         dead: list[int] = []
         for wid in wids:
-            ws = self._clients.get(wid)
-            if ws is None:
+            queue = self._queues.get(wid)
+            if queue is None:
                 dead.append(wid)
                 continue
             try:
-                await ws.send_text(payload)
-            except Exception:
+                queue.put_nowait(text)
+            except asyncio.QueueFull:
                 dead.append(wid)
-        # Cleanup dead connections
-        async with self._lock:
-            for wid in dead:
-                for syms in self._client_symbols.get(wid, set()):
-                    self._symbol_clients.get(syms, set()).discard(wid)
-                self._client_symbols.pop(wid, None)
-                self._clients.pop(wid, None)
+        if dead:
+            async with self._lock:
+                for wid in dead:
+                    ws = self._clients.get(wid)
+                    self._drop_client(wid)
+                    if ws is not None:
+                        task = asyncio.create_task(self._close(ws))
+                        self._closers.add(task)
+                        task.add_done_callback(self._closers.discard)
+
+    async def send_to(self, ws: WebSocket, text: str):
+        """Queue one frame for a single client, behind anything already queued."""
+        await self._fan_out((self._ws_id(ws),), text)
+
+    async def broadcast_tick(self, symbol: str, tick: dict):
+        """Send tick JSON to all clients subscribed to this symbol."""
+        if symbol not in self._symbol_clients:
+            return
+        # Encoded once and shared by every subscriber. Kept as a text frame:
+        # the mobile client JSON.parse()s event.data as a string.
+        await self.broadcast_frame(symbol, orjson.dumps(tick).decode())
+
+    async def broadcast_frame(self, symbol: str, text: str):
+        """Send an already-encoded frame to all clients subscribed to this symbol."""
+        wids = self._symbol_clients.get(symbol)
+        if wids:
+            await self._fan_out(wids, text)
+
+    async def broadcast_frames(self, frames: list[tuple[str, str]]):
+        """broadcast_frame() for a batch of (symbol, frame) pairs.
+
+        Batching clients get their share of the ticks merged into one
+        tick_batch frame. The merge joins the already-encoded tick strings,
+        so nothing is re-serialized per client.
+        """
+        if not self._batching:
+            for symbol, text in frames:
+                await self.broadcast_frame(symbol, text)
+            return
+
+        per_client: dict[int, list[str]] = {}
+        for symbol, text in frames:
+            wids = self._symbol_clients.get(symbol, frozenset())
+            single = [wid for wid in wids if wid not in self._batching]
+            if single:
+                await self._fan_out(single, text)
+            for wid in wids:
+                if wid in self._batching:
+                    per_client.setdefault(wid, []).append(text)
+        for wid, texts in per_client.items():
+            await self._fan_out((wid,), '{"type":"tick_batch","ticks":[' + ",".join(texts) + "]}")
 
     async def broadcast_status(self, connected: bool, source: str):
         """Send connection status to all connected clients."""
-        payload = json.dumps({"type": "status", "connected": connected, "source": source})
-        for ws in list(self._clients.values()):
-            try:
-                await ws.send_text(payload)
-            except Exception:
-                pass
+        payload = orjson.dumps({"type": "status", "connected": connected, "source": source}).decode()
+        await self._fan_out(list(self._clients), payload)
 
     async def broadcast_all(self, payload: dict):
         """Send a JSON message to ALL connected WebSocket clients."""
-        text = json.dumps(payload)
-        dead: list[int] = []
-        for wid, ws in list(self._clients.items()):
-            try:
-                await ws.send_text(text)
-            except Exception:
-                dead.append(wid)
-        if dead:
-            async with self._lock:
-                for wid in dead:
-                    for syms in self._client_symbols.get(wid, set()):
-                        self._symbol_clients.get(syms, set()).discard(wid)
-                    self._client_symbols.pop(wid, None)
-                    self._clients.pop(wid, None)
+        await self._fan_out(list(self._clients), orjson.dumps(payload).decode())
 
 
 # ─── Kite Service ─────────────────────────────────────────────────────────────
 
+def _yahoo_symbol(sym: str) -> str:
+    """Yahoo Finance ticker for a Kite symbol, e.g. "NSE:RELIANCE" → "RELIANCE.NS".
+
+    Any exchange other than NSE maps to the ".BO" suffix.
+    """
+    exchange, sep, ticker = sym.partition(":")
+    if not sep:
+        return sym
+    return ticker + (".NS" if exchange == "NSE" else ".BO")
+
+
 class KiteService:
     """
     Singleton that manages the KiteTicker connection and fans ticks
@@ -196,10 +373,26 @@ class KiteService:
         # Populated from settings at startup
         self._api_key: str = ""
         self._access_token: str = ""
+        # Kite REST headers; rebuilt only when the credentials change
+        self._rest_headers: dict[str, str] = {}
+        # RapidAPI headers for the Yahoo fallback; empty when it isn't configured
+        self._yahoo_headers: dict[str, str] = {}
 
-    async def start(self, api_key: str, access_token: str):
+    def _set_credentials(self, api_key: str, access_token: str):
         self._api_key = api_key
         self._access_token = access_token
+        self._rest_headers = {
+            "Authorization": f"token {api_key}:{access_token}",
+            "X-Kite-Version": "3",
+        }
+
+    async def start(self, api_key: str, access_token: str):
+        self._set_credentials(api_key, access_token)
+        if settings.indian_api_key:
+            self._yahoo_headers = {
+                "X-RapidAPI-Key": settings.indian_api_key,
+                "X-RapidAPI-Host": "yh-finance.p.rapidapi.com",
+            }
         self._loop = asyncio.get_event_loop()
 
         # Always load instrument cache (needed for symbol resolution)
@@ -255,10 +448,18 @@ class KiteService:
 
     def _on_ticks(self, ws, ticks: list[dict]):
         """Called on every tick from Zerodha. Runs in ticker thread."""
+        frames: list[tuple[str, str]] = []
+        # One timestamp and one set of lookups per Kite message, not per tick
+        now = int(time.time())
+        symbol_for = self.instruments.symbol
+        dumps = orjson.dumps
+        # Upstream stays subscribed after the last client leaves; don't
+        # build or encode ticks nobody will receive
+        is_watched = self.manager.is_watched
         for tick in ticks:
             token = tick.get("instrument_token")
-            symbol = self.instruments.symbol(token)
-            if not symbol:
+            symbol = symbol_for(token)
+            if not symbol or not is_watched(symbol):
                 continue
 
             last_price = tick.get("last_price", 0)
@@ -274,10 +475,15 @@ class KiteService:
                 "change": change,
                 "change_pct": change_pct,
                 "volume": tick.get("volume_traded", 0),
-                "ts": int(time.time()),
+                "ts": now,
             }
+            # Encode here on the ticker thread, not on the event loop
+            frames.append((symbol, dumps(payload).decode()))
+
+        # One hand-off per Kite message rather than one per instrument
+        if frames:
             asyncio.run_coroutine_threadsafe(
-                self.manager.broadcast_tick(symbol, payload), self._loop
+                self.manager.broadcast_frames(frames), self._loop
             )
 
     def _on_close(self, ws, code, reason):
@@ -341,7 +547,7 @@ class KiteService:
     async def refresh_token(self, new_access_token: str):
         """Hot-swap access token without redeployment."""
         logger.info("Refreshing Kite access token")
-        self._access_token = new_access_token
+        self._set_credentials(self._api_key, new_access_token)
         self._auth_failed = False   # Reset so reconnection is allowed with the new token
         if self._fallback_task:
             self._fallback_task.cancel()
@@ -383,56 +589,41 @@ class KiteService:
 
     async def _fetch_and_broadcast(self, symbols: list[str]):
         """Fetch prices from Yahoo Finance for given symbols and broadcast."""
-        from app.config import settings
-
-        if not settings.indian_api_key:
+        if not self._yahoo_headers:
             return
 
-        # Group by exchange, convert to Yahoo Finance format
-        yf_symbols = []
-        sym_map = {}
-        for sym in symbols:
-            if ":" in sym:
-                exchange, ticker = sym.split(":", 1)
-                suffix = ".NS" if exchange == "NSE" else ".BO"
-                yf_sym = ticker + suffix
-            else:
-                yf_sym = sym
-            yf_symbols.append(yf_sym)
-            sym_map[yf_sym] = sym
+        # Convert to Yahoo Finance format in one pass: Yahoo symbol → ours
+        sym_map = {_yahoo_symbol(sym): sym for sym in symbols}
+        yf_symbols = list(sym_map)
 
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.get(
-                    "https://yh-finance.p.rapidapi.com/market/v2/get-quotes",
-                    headers={
-                        "X-RapidAPI-Key": settings.indian_api_key,
-                        "X-RapidAPI-Host": "yh-finance.p.rapidapi.com",
-                    },
-                    params={"region": "IN", "symbols": ",".join(yf_symbols)},
-                )
-                if resp.status_code != 200:
-                    return
-                data = resp.json()
-                results = data.get("quoteResponse", {}).get("result", [])
-
-                for quote in results:
-                    yf_sym = quote.get("symbol", "")
-                    original_sym = sym_map.get(yf_sym, yf_sym)
-                    ltp = quote.get("regularMarketPrice", 0)
-                    change = round(quote.get("regularMarketChange", 0), 2)
-                    change_pct = round(quote.get("regularMarketChangePercent", 0), 2)
-
-                    payload = {
-                        "type": "tick",
-                        "symbol": original_sym,
-                        "ltp": ltp,
-                        "change": change,
-                        "change_pct": change_pct,
-                        "volume": quote.get("regularMarketVolume", 0),
-                        "ts": int(time.time()),
-                    }
-                    await self.manager.broadcast_tick(original_sym, payload)
+            resp = await get_rapidapi_client().get(
+                "https://yh-finance.p.rapidapi.com/market/v2/get-quotes",
+                headers=self._yahoo_headers,
+                params={"region": "IN", "symbols": ",".join(yf_symbols)},
+            )
+            if resp.status_code != 200:
+                return
+            data = resp.json()
+            results = data.get("quoteResponse", {}).get("result", [])
+
+            for quote in results:
+                yf_sym = quote.get("symbol", "")
+                original_sym = sym_map.get(yf_sym, yf_sym)
+                ltp = quote.get("regularMarketPrice", 0)
+                change = round(quote.get("regularMarketChange", 0), 2)
+                change_pct = round(quote.get("regularMarketChangePercent", 0), 2)
+
+                payload = {
+                    "type": "tick",
+                    "symbol": original_sym,
+                    "ltp": ltp,
+                    "change": change,
+                    "change_pct": change_pct,
+                    "volume": quote.get("regularMarketVolume", 0),
+                    "ts": int(time.time()),
+                }
+                await self.manager.broadcast_tick(original_sym, payload)
         except Exception as exc:
             logger.error("Yahoo Finance fallback fetch error: %s", exc)
 
@@ -1,24 +1,55 @@
-from app.services.supabase_client import get_supabase_admin
+import asyncio
+import hashlib
+from collections.abc import Callable
 
+import orjson
+from cachetools import TTLCache
 
-def build_client_context(client_id: str) -> dict:
+from app.services.supabase_client import get_supabase_admin_async, in_filter_chunks
+
+# Holdings and recent transactions ride along with each portfolio row, so a
+# whole book loads in one request instead of two per portfolio
+_PORTFOLIO_EMBED = "*, holdings(*), transactions(*)"
+
+
+def _split_portfolios(rows: list[dict]) -> tuple[list[dict], dict, dict]:
+    """Pull the embedded holdings/transactions out into per-portfolio dicts."""
+    holdings_by_portfolio = {}
+    transactions_by_portfolio = {}
+    for p in rows:
+        holdings_by_portfolio[p["id"]] = p.pop("holdings", None) or []
+        transactions_by_portfolio[p["id"]] = p.pop("transactions", None) or []
+    return rows, holdings_by_portfolio, transactions_by_portfolio
+
+
+async def build_client_context(client_id: str) -> dict:
     """Fetch portfolio data for a client to inject into AI chat context."""
-    supabase = get_supabase_admin()
+    supabase = await get_supabase_admin_async()
 
-    # Get client info
-    client = (
+    # Client info and portfolios (with their holdings and last 20 transactions
+    # each) don't depend on each other, so fetch them together
+    client, portfolios = await asyncio.gather(
         supabase.table("users")
         .select("*")
         .eq("id", client_id)
         .single()
-        .execute()
+        .execute(),
+        supabase.table("portfolios")
+        .select(_PORTFOLIO_EMBED)
+        .eq("client_id", client_id)
+        .order("date", desc=True, foreign_table="transactions")
+        .limit(20, foreign_table="transactions")
+        .execute(),
     )
     client_data = client.data if client.data else {}
+    portfolio_list, holdings_by_portfolio, transactions_by_portfolio = _split_portfolios(
+        portfolios.data or []
+    )
 
     # Get manager info
     manager_data = None
     if client_data.get("manager_id"):
-        manager = (
+        manager = await (
             supabase.table("users")
             .select("full_name, email")
             .eq("id", client_data["manager_id"])
@@ -27,102 +58,55 @@ def build_client_context(client_id: str) -> dict:
         )
         manager_data = manager.data
 
-    # Get portfolios
-    portfolios = (
-        supabase.table("portfolios")
-        .select("*")
-        .eq("client_id", client_id)
-        .execute()
-    )
-
-    holdings_by_portfolio = {}
-    transactions_by_portfolio = {}
-    for p in portfolios.data or []:
-        pid = p["id"]
-        h = (
-            supabase.table("holdings")
-            .select("*")
-            .eq("portfolio_id", pid)
-            .execute()
-        )
-        holdings_by_portfolio[pid] = h.data or []
-
-        t = (
-            supabase.table("transactions")
-            .select("*")
-            .eq("portfolio_id", pid)
-            .order("date", desc=True)
-            .limit(20)
-            .execute()
-        )
-        transactions_by_portfolio[pid] = t.data or []
-
     return {
         "client": client_data,
         "manager": manager_data,
-        "portfolios": portfolios.data or [],
+        "portfolios": portfolio_list,
         "holdings": holdings_by_portfolio,
         "transactions": transactions_by_portfolio,
     }
 
 
-def build_manager_context(manager_id: str) -> dict:
+async def build_manager_context(manager_id: str) -> dict:
     """Fetch all client portfolio data for a fund manager to inject into AI chat context."""
-    supabase = get_supabase_admin()
+    supabase = await get_supabase_admin_async()
 
-    # Get manager info
-    manager = (
+    # Manager info and the client list are independent
+    manager, clients = await asyncio.gather(
         supabase.table("users")
         .select("*")
         .eq("id", manager_id)
         .single()
-        .execute()
-    )
-    manager_data = manager.data if manager.data else {}
-
-    # Get all clients under this manager
-    clients = (
+        .execute(),
         supabase.table("users")
         .select("*")
         .eq("manager_id", manager_id)
         .eq("role", "client")
-        .execute()
+        .execute(),
     )
+    manager_data = manager.data if manager.data else {}
     client_list = clients.data or []
 
-    # Get all portfolios for these clients
+    # Get all portfolios for these clients, with their holdings and last 10
+    # transactions each — one query per chunk of client ids, run together
     client_ids = [c["id"] for c in client_list]
     all_portfolios = []
     holdings_by_portfolio = {}
     transactions_by_portfolio = {}
 
-    for cid in client_ids:
-        portfolios = (
+    if client_ids:
+        results = await asyncio.gather(*(
             supabase.table("portfolios")
-            .select("*")
-            .eq("client_id", cid)
+            .select(_PORTFOLIO_EMBED)
+            .in_("client_id", chunk)
+            .order("date", desc=True, foreign_table="transactions")
+            .limit(10, foreign_table="transactions")
             .execute()
+            for chunk in in_filter_chunks(client_ids)
+        ))
+        all_portfolios, holdings_by_portfolio, transactions_by_portfolio = _split_portfolios(
+            [row for result in results for row in (result.data or [])]
         )
-        for p in portfolios.data or []:
-            all_portfolios.append(p)
-            pid = p["id"]
-            h = (
-                supabase.table("holdings")
-                .select("*")
-                .eq("portfolio_id", pid)
-                .execute()
-            )
-            holdings_by_portfolio[pid] = h.data or []
-
-            t = (
-                supabase.table("transactions")
-                .select("*")
-                .eq("portfolio_id", pid)
-                .order("date", desc=True)
-                .limit(10)
-                .execute()
-            )
-            transactions_by_portfolio[pid] = t.data or []
 
     return {
         "manager": manager_data,
@@ -133,8 +117,62 @@ def build_manager_context(manager_id: str) -> dict:
     }
 
 
+# Rendered prompts keyed by a digest of the context they were built from, so
+# a follow-up chat turn over unchanged data skips the render. Any portfolio
+# change alters the context and therefore the key; no explicit invalidation.
+_prompt_cache: TTLCache[bytes, str] = TTLCache(maxsize=512, ttl=300)
+
+
+def _cached_render(kind: str, ctx: dict, render: Callable[[dict], str]) -> str:
+    try:
+        raw = orjson.dumps(ctx, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return render(ctx)
+    key = hashlib.blake2b(kind.encode() + b"\0" + raw, digest_size=16).digest()
+    prompt = _prompt_cache.get(key)
+    if prompt is None:
+        prompt = _prompt_cache[key] = render(ctx)
+    return prompt
+
+
 def format_manager_system_prompt(ctx: dict) -> str:
     """Format the manager's portfolio context into a system prompt string."""
+    return _cached_render("manager", ctx, _render_manager_prompt)
+
+
+def format_client_system_prompt(ctx: dict) -> str:
+    """Format the portfolio context into a system prompt string."""
+    return _cached_render("client", ctx, _render_client_prompt)
+
+
+_HOLDING_LINE = "{}- {}: {} units @ Rs.{:,.2f} = Rs.{:,.2f} ({})".format
+_TRANSACTION_LINE = "{}- {} {} x {} @ Rs.{:,.2f} on {}".format
+
+
+def _holding_lines(holdings: list[dict], indent: str) -> tuple[list[str], float]:
+    """One prompt line per holding, plus their total value (each cast once)."""
+    lines = []
+    total = 0.0
+    for h in holdings:
+        qty = h.get("quantity", 0)
+        cost = float(h.get("avg_cost", 0))
+        val = float(qty) * cost
+        total += val
+        lines.append(_HOLDING_LINE(indent, h["symbol"], qty, cost, val, h.get("asset_type", "stock")))
+    return lines, total
+
+
+def _transaction_lines(transactions: list[dict], indent: str):
+    return (
+        _TRANSACTION_LINE(
+            indent, t["type"].upper(), t.get("quantity", 0), t["symbol"],
+            float(t.get("price", 0)), t.get("date", "N/A"),
+        )
+        for t in transactions
+    )
+
+
+def _render_manager_prompt(ctx: dict) -> str:
     manager = ctx["manager"]
     manager_name = manager.get("full_name") or manager.get("email", "Fund Manager")
     clients = ctx["clients"]
@@ -147,9 +185,13 @@ def format_manager_system_prompt(ctx: dict) -> str:
 
     total_aum = 0.0
 
+    portfolios_by_client: dict[str, list[dict]] = {}
+    for p in ctx["portfolios"]:
+        portfolios_by_client.setdefault(p.get("client_id"), []).append(p)
+
     for client in clients:
         client_name = client.get("full_name") or client.get("email", "Client")
-        client_portfolios = [p for p in ctx["portfolios"] if p.get("client_id") == client["id"]]
+        client_portfolios = portfolios_by_client.get(client["id"], [])
 
         parts.append(f"## Client: {client_name} ({client.get('email', '')})")
 
@@ -159,29 +201,15 @@ def format_manager_system_prompt(ctx: dict) -> str:
             holdings = ctx["holdings"].get(pid, [])
             transactions = ctx["transactions"].get(pid, [])
 
-            portfolio_value = sum(
-                float(h.get("quantity", 0)) * float(h.get("avg_cost", 0))
-                for h in holdings
-            )
+            holding_lines, portfolio_value = _holding_lines(holdings, "  ")
             total_aum += portfolio_value
 
             parts.append(f"### Portfolio: {pname} ({len(holdings)} holdings, Value: Rs.{portfolio_value:,.2f})")
-
-            if holdings:
-                for h in holdings:
-                    qty = h.get("quantity", 0)
-                    cost = h.get("avg_cost", 0)
-                    val = float(qty) * float(cost)
-                    parts.append(
-                        f"  - {h['symbol']}: {qty} units @ Rs.{float(cost):,.2f} = Rs.{val:,.2f} ({h.get('asset_type', 'stock')})"
-                    )
+            parts.extend(holding_lines)
 
             if transactions:
-                parts.append(f"  Recent transactions:")
-                for t in transactions[:5]:
-                    parts.append(
-                        f"  - {t['type'].upper()} {t.get('quantity', 0)} x {t['symbol']} @ Rs.{float(t.get('price', 0)):,.2f} on {t.get('date', 'N/A')}"
-                    )
+                parts.append("  Recent transactions:")
+                parts.extend(_transaction_lines(transactions[:5], "  "))
 
         parts.append("")
 
@@ -206,8 +234,7 @@ def format_manager_system_prompt(ctx: dict) -> str:
     return "\n".join(parts)
 
 
-def format_client_system_prompt(ctx: dict) -> str:
-    """Format the portfolio context into a system prompt string."""
+def _render_client_prompt(ctx: dict) -> str:
     client = ctx["client"]
     manager = ctx["manager"]
     client_name = client.get("full_name") or client.get("email", "Client")
@@ -228,27 +255,15 @@ def format_client_system_prompt(ctx: dict) -> str:
         parts.append(f"## Portfolio: {pname}")
 
         if holdings:
-            total_value = sum(
-                float(h.get("quantity", 0)) * float(h.get("avg_cost", 0))
-                for h in holdings
-            )
+            holding_lines, total_value = _holding_lines(holdings, "")
             parts.append(f"### Holdings ({len(holdings)} total, Invested: Rs.{total_value:,.2f}):")
-            for h in holdings:
-                qty = h.get("quantity", 0)
-                cost = h.get("avg_cost", 0)
-                val = float(qty) * float(cost)
-                parts.append(
-                    f"- {h['symbol']}: {qty} units @ Rs.{float(cost):,.2f} = Rs.{val:,.2f} ({h.get('asset_type', 'stock')})"
-                )
+            parts.extend(holding_lines)
         else:
             parts.append("### Holdings: None yet")
 
         if transactions:
-            parts.append(f"\n### Recent Transactions:")
-            for t in transactions[:10]:
-                parts.append(
-                    f"- {t['type'].upper()} {t.get('quantity', 0)} x {t['symbol']} @ Rs.{float(t.get('price', 0)):,.2f} on {t.get('date', 'N/A')}"
-                )
+            parts.append("\n### Recent Transactions:")
+            parts.extend(_transaction_lines(transactions[:10], ""))
 
         parts.append("")
 
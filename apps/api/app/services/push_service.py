@@ -4,15 +4,16 @@ Expo Push Notification service.
 Uses the Expo Push API (https://exp.host/--/api/v2/push/send).
 No API key required for Expo push tokens (ExponentPushToken[...]).
 """
+import asyncio
 import logging
 
-import httpx
-
+from app.services.http_clients import get_expo_client
 from app.services.supabase_client import get_supabase_admin
 
 logger = logging.getLogger(__name__)
 
 EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_MAX_BATCH = 100
 
 
 async def send_push(tokens: list[str], title: str, body: str, data: dict | None = None) -> None:
@@ -31,13 +32,18 @@ async def send_push(tokens: list[str], title: str, body: str, data: dict | None
         for token in tokens
     ]
 
+    # Expo caps a request at 100 messages; send the chunks concurrently
+    chunks = [messages[i:i + EXPO_MAX_BATCH] for i in range(0, len(messages), EXPO_MAX_BATCH)]
+    await asyncio.gather(*(_post_chunk(chunk) for chunk in chunks))
+
+
+async def _post_chunk(messages: list[dict]) -> None:
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.post(
-                EXPO_PUSH_URL,
-                json=messages,
-                headers={"Content-Type": "application/json", "Accept": "application/json"},
-            )
+        resp = await get_expo_client().post(
+            EXPO_PUSH_URL,
+            json=messages,
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
         if resp.status_code != 200:
             logger.warning("[push] Expo API returned %s: %s", resp.status_code, resp.text[:200])
             return
@@ -50,17 +56,27 @@ async def send_push(tokens: list[str], title: str, body: str, data: dict | None
         logger.error("[push] Failed to send push notifications: %s", exc)
 
 
-async def send_to_user(user_id: str, title: str, body: str, data: dict | None = None) -> None:
-    """Fetch all push tokens for a user and send them a notification."""
+async def send_to_user(
+    user_id: str,
+    title: str,
+    body: str,
+    data: dict | None = None,
+    tokens: list[str] | None = None,
+) -> None:
+    """Send a notification to all of a user's push tokens.
+
+    Pass ``tokens`` when the caller has already loaded them to skip the lookup.
+    """
     try:
-        supabase = get_supabase_admin()
-        result = (
-            supabase.table("push_tokens")
-            .select("token")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        tokens = [row["token"] for row in (result.data or [])]
+        if tokens is None:
+            supabase = get_supabase_admin()
+            result = (
+                supabase.table("push_tokens")
+                .select("token")
+                .eq("user_id", user_id)
+                .execute()
+            )
+            tokens = [row["token"] for row in (result.data or [])]
         await send_push(tokens, title, body, data)
     except Exception as exc:
         logger.error("[push] Error fetching tokens for user %s: %s", user_id, exc)
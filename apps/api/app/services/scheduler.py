@@ -10,15 +10,15 @@ Jobs (all times IST = UTC+5:30):
 """
 import asyncio
 import logging
-import xml.etree.ElementTree as ET
 from datetime import datetime, timezone, timedelta
 from email.utils import parsedate_to_datetime
 
-import httpx
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from lxml import etree
 
+from app.services.http_clients import get_kite_client, get_rss_client
 from app.services.push_service import send_push
-from app.services.supabase_client import get_supabase_admin
+from app.services.supabase_client import get_supabase_admin, in_filter_chunks
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -48,6 +48,15 @@ COMMON_HEADERS = {
     "Accept-Language": "en-IN,en;q=0.9",
 }
 
+# libxml2 parses the raw bytes directly; recover=True keeps going past the
+# malformed markup some publisher feeds ship. Entities and network access
+# stay off since the XML is untrusted.
+_RSS_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+
+# Conditional-GET state per feed URL: (ETag, Last-Modified, parsed articles).
+# A 304 reply reuses the articles parsed from the last 200.
+_feed_cache: dict[str, tuple[str | None, str | None, list[dict]]] = {}
+
 # In-session dedup sets — reset on server restart; the 45-min timestamp filter is the
 # primary guard against re-notifying after a restart.
 _seen_market_news: set[str] = set()
@@ -87,8 +96,7 @@ async def _get_kite_quotes(symbols: list[str]) -> dict:
     async def _fetch_batch(batch: list[str]) -> dict:
         params = [("i", sym) for sym in batch]
         try:
-            async with httpx.AsyncClient(headers=headers, timeout=20) as client:
-                resp = await client.get("https://api.kite.trade/quote", params=params)
+            resp = await get_kite_client().get("/quote", params=params, headers=headers, timeout=20)
             if resp.status_code != 200:
                 return {}
             return resp.json().get("data", {})
@@ -102,18 +110,99 @@ async def _get_kite_quotes(symbols: list[str]) -> dict:
     return merged
 
 
+# PostgREST caps rows per response, so bulk reads page through the results
+_PAGE_SIZE = 1000
+
+
+def _select_in(supabase, table: str, columns: str, column: str, values: list[str]) -> list[dict]:
+    """All rows of `table` whose `column` is in `values`."""
+    rows: list[dict] = []
+    for chunk in in_filter_chunks(values):
+        start = 0
+        while True:
+            result = (
+                supabase.table(table)
+                .select(columns)
+                .in_(column, chunk)
+                .order("id")
+                .range(start, start + _PAGE_SIZE - 1)
+                .execute()
+            )
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                break
+            start += _PAGE_SIZE
+    return rows
+
+
+def _load_holdings_by_user(supabase, user_ids: list[str], columns: str) -> dict[str, list[dict]]:
+    """
+    Holdings across all of each user's portfolios, in two bulk queries
+    instead of two per user. Users without holdings are absent.
+    """
+    portfolios = _select_in(supabase, "portfolios", "id, client_id", "client_id", user_ids)
+    user_by_port = {p["id"]: p["client_id"] for p in portfolios}
+    if not user_by_port:
+        return {}
+
+    holdings = _select_in(
+        supabase, "holdings", f"portfolio_id, {columns}", "portfolio_id", list(user_by_port)
+    )
+    holdings_by_user: dict[str, list[dict]] = {}
+    for h in holdings:
+        holdings_by_user.setdefault(user_by_port[h["portfolio_id"]], []).append(h)
+    return holdings_by_user
+
+
+# Per-user work in the push jobs runs concurrently, capped so a large user
+# base can't exhaust the Expo client's connection pool
+USER_CONCURRENCY = 32
+
+
+async def _for_each_user(user_tokens: dict[str, list[str]], process, log_tag: str) -> None:
+    """Run `process(user_id, tokens)` for every user; one failure doesn't stop the rest."""
+    sem = asyncio.Semaphore(USER_CONCURRENCY)
+
+    async def _run(user_id: str, tokens: list[str]) -> None:
+        async with sem:
+            try:
+                await process(user_id, tokens)
+            except Exception as exc:
+                logger.error("[scheduler] %s error for user %s: %s", log_tag, user_id, exc)
+
+    await asyncio.gather(
+        *(_run(user_id, tokens) for user_id, tokens in user_tokens.items()),
+        return_exceptions=True,
+    )
+
+
 async def _fetch_rss_articles(feed_url: str) -> list[dict]:
     """
     Fetch and parse one RSS feed URL.
     Returns list of {title: str, url: str, published_at: datetime (UTC)}.
     """
     try:
-        async with httpx.AsyncClient(timeout=12, headers=COMMON_HEADERS, follow_redirects=True) as client:
-            resp = await client.get(feed_url)
+        headers = COMMON_HEADERS
+        cached = _feed_cache.get(feed_url)
+        if cached is not None:
+            etag, last_modified, cached_articles = cached
+            headers = dict(COMMON_HEADERS)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        resp = await get_rss_client().get(feed_url, headers=headers)
+        if resp.status_code == 304 and cached is not None:
+            return cached_articles
         if resp.status_code != 200:
             return []
-        root = ET.fromstring(resp.text)
-        channel = root.find("channel") or root
+        root = etree.fromstring(resp.content, parser=_RSS_PARSER)
+        if root is None:
+            return []
+        channel = root.find("channel")
+        if channel is None:
+            channel = root
         articles = []
         for item in channel.findall("item"):
             title_raw = (item.findtext("title") or "").strip()
@@ -130,6 +219,12 @@ async def _fetch_rss_articles(feed_url: str) -> list[dict]:
             except Exception:
                 pub_dt = datetime.now(timezone.utc)
             articles.append({"title": title, "url": article_url, "published_at": pub_dt})
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            _feed_cache[feed_url] = (etag, last_modified, articles)
+        else:
+            _feed_cache.pop(feed_url, None)
         return articles
     except Exception:
         return []
@@ -231,53 +326,41 @@ async def job_daily_summary():
     for row in tokens_result.data:
         user_tokens.setdefault(row["user_id"], []).append(row["token"])
 
-    for user_id, tokens in user_tokens.items():
-        try:
-            portfolios_result = (
-                supabase.table("portfolios")
-                .select("id")
-                .eq("client_id", user_id)
-                .execute()
-            )
-            if not portfolios_result.data:
-                continue
+    holdings_by_user = _load_holdings_by_user(
+        supabase, list(user_tokens), "symbol, quantity, average_price"
+    )
+    # One quote fetch for every symbol held by anyone, shared by all users
+    quotes = await _get_kite_quotes(
+        sorted({h["symbol"] for holdings in holdings_by_user.values() for h in holdings})
+    )
 
-            portfolio_ids = [p["id"] for p in portfolios_result.data]
-            holdings_result = (
-                supabase.table("holdings")
-                .select("symbol, quantity, average_price")
-                .in_("portfolio_id", portfolio_ids)
-                .execute()
-            )
-            if not holdings_result.data:
-                continue
+    async def _process_user(user_id: str, tokens: list[str]) -> None:
+        holdings = holdings_by_user.get(user_id)
+        if not holdings:
+            return
 
-            holdings = holdings_result.data
-            symbols = list({h["symbol"] for h in holdings})
-            quotes = await _get_kite_quotes(symbols)
-
-            total_value = 0.0
-            total_invested = 0.0
-            for h in holdings:
-                sym = h["symbol"]
-                qty = float(h.get("quantity", 0))
-                avg = float(h.get("average_price", 0))
-                quote_data = quotes.get(f"NSE:{sym}", {})
-                ltp = float(quote_data.get("last_price", avg))
-                total_value += ltp * qty
-                total_invested += avg * qty
-
-            if total_invested == 0:
-                continue
+        total_value = 0.0
+        total_invested = 0.0
+        for h in holdings:
+            sym = h["symbol"]
+            qty = float(h.get("quantity", 0))
+            avg = float(h.get("average_price", 0))
+            quote_data = quotes.get(f"NSE:{sym}", {})
+            ltp = float(quote_data.get("last_price", avg))
+            total_value += ltp * qty
+            total_invested += avg * qty
+
+        if total_invested == 0:
+            return
 
-            day_pct = ((total_value - total_invested) / total_invested) * 100
-            arrow = "📈" if day_pct >= 0 else "📉"
-            sign = "+" if day_pct >= 0 else ""
-            body = f"{_fmt_inr(total_value)} · {sign}{day_pct:.1f}% overall {arrow}"
+        day_pct = ((total_value - total_invested) / total_invested) * 100
+        arrow = "📈" if day_pct >= 0 else "📉"
+        sign = "+" if day_pct >= 0 else ""
+        body = f"{_fmt_inr(total_value)} · {sign}{day_pct:.1f}% overall {arrow}"
 
-            await send_push(tokens, "Good morning! Portfolio update", body, {"screen": "portfolio"})
-        except Exception as exc:
-            logger.error("[scheduler] daily_summary error for user %s: %s", user_id, exc)
+        await send_push(tokens, "Good morning! Portfolio update", body, {"screen": "portfolio"})
+
+    await _for_each_user(user_tokens, _process_user, "daily_summary")
 
 
 async def job_news_alerts():
@@ -324,57 +407,53 @@ async def job_news_alerts():
     if not new_articles:
         return
 
-    for user_id, tokens in user_tokens.items():
-        try:
-            portfolios_result = (
-                supabase.table("portfolios")
-                .select("id")
-                .eq("client_id", user_id)
-                .execute()
-            )
-            if not portfolios_result.data:
-                continue
-
-            portfolio_ids = [p["id"] for p in portfolios_result.data]
-            holdings_result = (
-                supabase.table("holdings")
-                .select("symbol, quantity")
-                .in_("portfolio_id", portfolio_ids)
-                .execute()
-            )
-            if not holdings_result.data:
-                continue
-
-            # Top 5 symbols by quantity
-            sorted_holdings = sorted(
-                holdings_result.data,
-                key=lambda h: float(h.get("quantity", 0)),
-                reverse=True,
-            )
-            top_symbols = [h["symbol"].upper() for h in sorted_holdings[:5]]
-
-            # Articles that mention one of the user's holdings in the title
-            user_articles = [
-                a for a in new_articles
-                if any(sym.lower() in a["title"].lower() for sym in top_symbols)
-            ]
-
-            if not user_articles:
-                continue
-
-            headline = user_articles[0]["title"][:100]
-            count = len(user_articles)
-            body = headline if count == 1 else f"{headline} (+{count - 1} more)"
-
-            await send_push(
-                tokens,
-                "Portfolio News",
-                body,
-                {"screen": "news", "url": user_articles[0].get("url", "")},
-            )
-            logger.info("[scheduler] news_alerts sent to user %s (%d articles)", user_id, count)
-        except Exception as exc:
-            logger.error("[scheduler] news_alerts error for user %s: %s", user_id, exc)
+    holdings_by_user = _load_holdings_by_user(supabase, list(user_tokens), "symbol, quantity")
+
+    # Top 5 symbols by quantity per user, lowercased for title matching
+    top_symbols_by_user: dict[str, frozenset[str]] = {}
+    for user_id, holdings in holdings_by_user.items():
+        sorted_holdings = sorted(
+            holdings,
+            key=lambda h: float(h.get("quantity", 0)),
+            reverse=True,
+        )
+        top_symbols_by_user[user_id] = frozenset(h["symbol"].lower() for h in sorted_holdings[:5])
+
+    # Match each title against the union of everyone's symbols once; users
+    # then only intersect their own symbols with each article's hit set
+    all_symbols = frozenset().union(*top_symbols_by_user.values())
+    article_hits: list[frozenset[str]] = []
+    for a in new_articles:
+        title = a["title"].lower()
+        article_hits.append(frozenset(sym for sym in all_symbols if sym in title))
+
+    async def _process_user(user_id: str, tokens: list[str]) -> None:
+        top_symbols = top_symbols_by_user.get(user_id)
+        if not top_symbols:
+            return
+
+        # Articles that mention one of the user's holdings in the title
+        user_articles = [
+            a for a, hits in zip(new_articles, article_hits)
+            if not top_symbols.isdisjoint(hits)
+        ]
+
+        if not user_articles:
+            return
+
+        headline = user_articles[0]["title"][:100]
+        count = len(user_articles)
+        body = headline if count == 1 else f"{headline} (+{count - 1} more)"
+
+        await send_push(
+            tokens,
+            "Portfolio News",
+            body,
+            {"screen": "news", "url": user_articles[0].get("url", "")},
+        )
+        logger.info("[scheduler] news_alerts sent to user %s (%d articles)", user_id, count)
+
+    await _for_each_user(user_tokens, _process_user, "news_alerts")
 
 
 async def job_ws_news_broadcast():
@@ -438,53 +517,41 @@ async def job_weekly_report():
     for row in tokens_result.data:
         user_tokens.setdefault(row["user_id"], []).append(row["token"])
 
-    for user_id, tokens in user_tokens.items():
-        try:
-            portfolios_result = (
-                supabase.table("portfolios")
-                .select("id")
-                .eq("client_id", user_id)
-                .execute()
-            )
-            if not portfolios_result.data:
-                continue
-
-            portfolio_ids = [p["id"] for p in portfolios_result.data]
-            holdings_result = (
-                supabase.table("holdings")
-                .select("symbol, quantity, average_price")
-                .in_("portfolio_id", portfolio_ids)
-                .execute()
-            )
-            if not holdings_result.data:
-                continue
-
-            holdings = holdings_result.data
-            symbols = list({h["symbol"] for h in holdings})
-            quotes = await _get_kite_quotes(symbols)
-
-            total_value = 0.0
-            total_invested = 0.0
-            for h in holdings:
-                sym = h["symbol"]
-                qty = float(h.get("quantity", 0))
-                avg = float(h.get("average_price", 0))
-                quote_data = quotes.get(f"NSE:{sym}", {})
-                ltp = float(quote_data.get("last_price", avg))
-                total_value += ltp * qty
-                total_invested += avg * qty
-
-            if total_invested == 0:
-                continue
-
-            overall_pct = ((total_value - total_invested) / total_invested) * 100
-            arrow = "📈" if overall_pct >= 0 else "📉"
-            sign = "+" if overall_pct >= 0 else ""
-            body = f"{_fmt_inr(total_value)} · {sign}{overall_pct:.1f}% overall {arrow}"
+    holdings_by_user = _load_holdings_by_user(
+        supabase, list(user_tokens), "symbol, quantity, average_price"
+    )
+    # One quote fetch for every symbol held by anyone, shared by all users
+    quotes = await _get_kite_quotes(
+        sorted({h["symbol"] for holdings in holdings_by_user.values() for h in holdings})
+    )
 
-            await send_push(tokens, "Weekly Portfolio Report", body, {"screen": "portfolio"})
-        except Exception as exc:
-            logger.error("[scheduler] weekly_report error for user %s: %s", user_id, exc)
+    async def _process_user(user_id: str, tokens: list[str]) -> None:
+        holdings = holdings_by_user.get(user_id)
+        if not holdings:
+            return
+
+        total_value = 0.0
+        total_invested = 0.0
+        for h in holdings:
+            sym = h["symbol"]
+            qty = float(h.get("quantity", 0))
+            avg = float(h.get("average_price", 0))
+            quote_data = quotes.get(f"NSE:{sym}", {})
+            ltp = float(quote_data.get("last_price", avg))
+            total_value += ltp * qty
+            total_invested += avg * qty
+
+        if total_invested == 0:
+            return
+
+        overall_pct = ((total_value - total_invested) / total_invested) * 100
+        arrow = "📈" if overall_pct >= 0 else "📉"
+        sign = "+" if overall_pct >= 0 else ""
+        body = f"{_fmt_inr(total_value)} · {sign}{overall_pct:.1f}% overall {arrow}"
+
+        await send_push(tokens, "Weekly Portfolio Report", body, {"screen": "portfolio"})
+
+    await _for_each_user(user_tokens, _process_user, "weekly_report")
 
 
 # ── Lifecycle ──────────────────────────────────────────────────────────────────
@@ -0,0 +1,37 @@
+"""
+Single-flight cache fill for upstream fetches.
+
+Concurrent misses for the same key share one in-flight upstream call
+instead of each making their own; the result lands in the caller's cache.
+"""
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable, MutableMapping
+from typing import Any
+
+# (id(cache), key) → task, so callers with separate caches never share a fetch
+_inflight: dict[tuple[int, Hashable], asyncio.Task] = {}
+
+
+async def cached_fetch(
+    cache: MutableMapping[Any, Any],
+    key: Hashable,
+    fetch: Callable[[], Awaitable[Any]],
+) -> Any:
+    """Return cache[key], filling it via fetch() at most once at a time."""
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    flight_key = (id(cache), key)
+    task = _inflight.get(flight_key)
+    if task is None:
+        async def _fetch_and_store():
+            result = await fetch()
+            cache[key] = result
+            return result
+
+        task = asyncio.create_task(_fetch_and_store())
+        _inflight[flight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(flight_key, None))
+    # shield() keeps a disconnecting caller from cancelling the others' fetch
+    return await asyncio.shield(task)
@@ -1,9 +1,22 @@
-from supabase import create_client, Client
+import httpx
+from supabase import AsyncClient, Client, acreate_client, create_client
+from supabase.lib.client_options import AsyncClientOptions
 
 from app.config import settings
 
 _client: Client | None = None
 _admin_client: Client | None = None
+_admin_async_client: AsyncClient | None = None
+_admin_async_http: httpx.AsyncClient | None = None
+
+# PostgREST puts .in_() filters in the URL, so long id lists go out in chunks
+# of this size to stay under URL-length limits
+IN_FILTER_CHUNK = 100
+
+
+def in_filter_chunks(values: list[str]) -> list[list[str]]:
+    """Split values for .in_() filters into IN_FILTER_CHUNK-sized lists."""
+    return [values[i:i + IN_FILTER_CHUNK] for i in range(0, len(values), IN_FILTER_CHUNK)]
 
 
 def get_supabase_client() -> Client:
@@ -22,3 +35,32 @@ def get_supabase_admin() -> Client:
             settings.supabase_url, settings.supabase_service_key
         )
     return _admin_client
+
+
+async def get_supabase_admin_async() -> AsyncClient:
+    """Async service-role client, for handlers that await queries directly
+    instead of blocking the event loop (or a worker thread) on the sync one."""
+    global _admin_async_client, _admin_async_http
+    if _admin_async_client is None:
+        # One pooled HTTP/2 connection carries every concurrent query instead
+        # of a TLS handshake per burst
+        _admin_async_http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+            timeout=httpx.Timeout(30, connect=5),
+        )
+        _admin_async_client = await acreate_client(
+            settings.supabase_url,
+            settings.supabase_service_key,
+            options=AsyncClientOptions(httpx_client=_admin_async_http),
+        )
+    return _admin_async_client
+
+
+async def close_supabase_admin_async() -> None:
+    """Close the async client's connection pool (called on app shutdown)."""
+    global _admin_async_client, _admin_async_http
+    if _admin_async_http is not None:
+        await _admin_async_http.aclose()
+        _admin_async_http = None
+    _admin_async_client = None
@@ -1,7 +1,7 @@
 import { useEffect, useRef, useCallback } from "react";
 import { useDispatch, useSelector } from "react-redux";
 import * as Notifications from "expo-notifications";
-import { setTick, setStatus } from "../store/slices/marketSlice";
+import { setTick, setTicks, setStatus } from "../store/slices/marketSlice";
 import type { RootState, AppDispatch } from "../store";
 
 const API_URL = process.env.EXPO_PUBLIC_API_URL ?? "http://localhost:8000";
@@ -47,7 +47,8 @@ export function useMarketWebSocket(symbols: string[]) {
     if (!session?.access_token) return;
     if (wsRef.current?.readyState === WebSocket.OPEN) return;
 
-    const url = `${WS_URL}/ws/prices?token=${session.access_token}`;
+    // batch=1: ticks from one upstream message arrive as a single tick_batch frame
+    const url = `${WS_URL}/ws/prices?token=${session.access_token}&batch=1`;
     const ws = new WebSocket(url);
     wsRef.current = ws;
 
@@ -59,7 +60,21 @@ export function useMarketWebSocket(symbols: string[]) {
     ws.onmessage = (event) => {
       try {
         const msg = JSON.parse(event.data as string);
-        if (msg.type === "tick") {
+        if (msg.type === "tick_batch") {
+          const now = Date.now();
+          dispatch(
+            setTicks(
+              (msg.ticks ?? []).map((t: any) => ({
+                symbol: t.symbol,
+                ltp: t.ltp,
+                change: t.change,
+                changePct: t.change_pct,
+                volume: t.volume ?? 0,
+                updatedAt: now,
+              }))
+            )
+          );
+        } else if (msg.type === "tick") {
           dispatch(
             setTick({
               symbol: msg.symbol,
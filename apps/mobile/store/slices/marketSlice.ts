@@ -29,6 +29,11 @@ const marketSlice = createSlice({
       const { symbol, ...price } = action.payload;
       state.prices[symbol] = price;
     },
+    setTicks(state, action: PayloadAction<Array<{ symbol: string } & PriceEntry>>) {
+      for (const { symbol, ...price } of action.payload) {
+        state.prices[symbol] = price;
+      }
+    },
     setStatus(
       state,
       action: PayloadAction<{ connected: boolean; source: MarketState["source"] }>
@@ -44,7 +49,7 @@ const marketSlice = createSlice({
   },
 });
 
-export const { setTick, setStatus, clearPrices } = marketSlice.actions;
+export const { setTick, setTicks, setStatus, clearPrices } = marketSlice.actions;
 export default marketSlice.reducer;
 
 // ── Selectors ────────────────────────────────────────────────────────────────
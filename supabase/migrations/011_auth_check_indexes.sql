@@ -0,0 +1,11 @@
+-- Migration 011: Covering indexes for ownership checks
+--
+-- The API verifies access with lookups like
+--   users WHERE id = ? AND manager_id = ?   (select "id")
+--   portfolios WHERE id = ?                 (select "client_id")
+-- The single-column indexes from 001 (idx_users_manager_id,
+-- idx_portfolios_client_id) stay; these composites let Postgres answer the
+-- checks with index-only scans.
+
+CREATE INDEX IF NOT EXISTS idx_users_id_manager_id ON public.users(id, manager_id);
+CREATE INDEX IF NOT EXISTS idx_portfolios_id_client_id ON public.portfolios(id, client_id);
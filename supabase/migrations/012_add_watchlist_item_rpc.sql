@@ -0,0 +1,28 @@
+-- Migration 012: Owner-checked watchlist item upsert
+--
+-- POST /watchlists/{id}/items used to select the watchlist to check
+-- ownership, then upsert the item: two round-trips. This function does both
+-- in one statement. It returns no rows when the watchlist does not belong to
+-- the user, which the API maps to 404.
+
+CREATE OR REPLACE FUNCTION public.add_watchlist_item(
+  p_user_id uuid,
+  p_watchlist_id uuid,
+  p_symbol text,
+  p_name text
+)
+RETURNS SETOF public.watchlist_items
+LANGUAGE sql
+AS $$
+  INSERT INTO public.watchlist_items (watchlist_id, symbol, name)
+  SELECT w.id, p_symbol, p_name
+  FROM public.watchlists w
+  WHERE w.id = p_watchlist_id
+    AND w.user_id = p_user_id
+  ON CONFLICT (watchlist_id, symbol) DO UPDATE SET name = EXCLUDED.name
+  RETURNING *;
+$$;
+
+-- Takes the user id as an argument, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.add_watchlist_item(uuid, uuid, text, text)
+  FROM public, anon, authenticated;
@@ -0,0 +1,70 @@
+-- Migration 013: Period performance metrics computed in Postgres
+--
+-- GET /portfolios/{id}/performance used to download every snapshot in the
+-- range (up to five years of daily rows) and scan them in Python for each
+-- period's start and end values. This function returns one row per period
+-- instead, using idx_portfolio_snapshots_pid_date_covering (added in 016,
+-- replacing idx_portfolio_snapshots_portfolio_date) for the lookups.
+--
+--   daily:   last 7 days, each day vs the day before (both snapshots required)
+--   monthly: last 6 months, first snapshot on the 1st (or the day before)
+--            vs the last snapshot on or before month end
+--   yearly:  last 5 years, same rule as monthly at year granularity
+
+CREATE OR REPLACE FUNCTION public.portfolio_period_metrics(
+  p_portfolio_id uuid,
+  p_period text
+)
+RETURNS TABLE (
+  period_start date,
+  period_end date,
+  value_start numeric,
+  value_end numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH unit AS (
+    SELECT
+      CASE p_period WHEN 'daily' THEN 'day' WHEN 'monthly' THEN 'month' ELSE 'year' END AS field,
+      CASE p_period WHEN 'daily' THEN interval '1 day'
+                    WHEN 'monthly' THEN interval '1 month'
+                    ELSE interval '1 year' END AS step,
+      CASE p_period WHEN 'daily' THEN 7 WHEN 'monthly' THEN 6 ELSE 5 END AS n
+  ),
+  buckets AS (
+    SELECT
+      (date_trunc(u.field, current_date) - k * u.step)::date AS bucket,
+      u.step,
+      p_period = 'daily' AS is_daily
+    FROM unit u, generate_series(u.n - 1, 0, -1) AS k
+  ),
+  bounds AS (
+    SELECT
+      CASE WHEN is_daily THEN bucket - 1 ELSE bucket END AS period_start,
+      CASE WHEN is_daily THEN bucket ELSE (bucket + step - interval '1 day')::date END AS period_end,
+      bucket - 1 AS start_lo,
+      CASE WHEN is_daily THEN bucket - 1 ELSE bucket END AS start_hi,
+      CASE WHEN is_daily THEN bucket ELSE bucket - 1 END AS end_lo
+    FROM buckets
+  )
+  SELECT b.period_start, b.period_end, s.total_value, e.total_value
+  FROM bounds b
+  JOIN LATERAL (
+    SELECT ps.total_value
+    FROM public.portfolio_snapshots ps
+    WHERE ps.portfolio_id = p_portfolio_id
+      AND ps.snapshot_date BETWEEN b.start_lo AND b.start_hi
+    ORDER BY ps.snapshot_date
+    LIMIT 1
+  ) s ON true
+  JOIN LATERAL (
+    SELECT ps.total_value
+    FROM public.portfolio_snapshots ps
+    WHERE ps.portfolio_id = p_portfolio_id
+      AND ps.snapshot_date BETWEEN b.end_lo AND b.period_end
+    ORDER BY ps.snapshot_date DESC
+    LIMIT 1
+  ) e ON true
+  ORDER BY b.period_start;
+$$;
@@ -0,0 +1,32 @@
+-- Migration 014: Owner-checked watchlist item removal
+--
+-- Companion to add_watchlist_item (012). Deletes the symbol only if the
+-- watchlist belongs to the user, in one statement. Returns whether the
+-- watchlist is the user's, so the API can still answer 404 for someone
+-- else's list and 204 when the symbol simply was not on it.
+
+CREATE OR REPLACE FUNCTION public.remove_watchlist_item(
+  p_user_id uuid,
+  p_watchlist_id uuid,
+  p_symbol text
+)
+RETURNS boolean
+LANGUAGE sql
+AS $$
+  WITH owned AS (
+    SELECT w.id
+    FROM public.watchlists w
+    WHERE w.id = p_watchlist_id
+      AND w.user_id = p_user_id
+  ), removed AS (
+    DELETE FROM public.watchlist_items i
+    USING owned o
+    WHERE i.watchlist_id = o.id
+      AND i.symbol = p_symbol
+  )
+  SELECT EXISTS (SELECT 1 FROM owned);
+$$;
+
+-- Takes the user id as an argument, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.remove_watchlist_item(uuid, uuid, text)
+  FROM public, anon, authenticated;
@@ -0,0 +1,44 @@
+-- Migration 015: Access-checked snapshot upsert
+--
+-- POST /portfolios/{id}/snapshots used to read the portfolio, then its
+-- client, then upsert: three round-trips. This function writes the snapshot
+-- only when the user is the portfolio's client or that client's manager,
+-- and returns the upserted row (no row means not found / no access).
+
+CREATE OR REPLACE FUNCTION public.create_portfolio_snapshot(
+  p_user_id uuid,
+  p_snapshot jsonb
+)
+RETURNS SETOF public.portfolio_snapshots
+LANGUAGE sql
+AS $$
+  INSERT INTO public.portfolio_snapshots (
+    portfolio_id, snapshot_date, total_value, invested_value,
+    returns_amount, returns_percent, holdings_count, snapshot_data
+  )
+  SELECT
+    p.id,
+    (p_snapshot->>'snapshot_date')::date,
+    (p_snapshot->>'total_value')::numeric,
+    (p_snapshot->>'invested_value')::numeric,
+    (p_snapshot->>'returns_amount')::numeric,
+    (p_snapshot->>'returns_percent')::numeric,
+    (p_snapshot->>'holdings_count')::integer,
+    NULLIF(p_snapshot->'snapshot_data', 'null'::jsonb)
+  FROM public.portfolios p
+  JOIN public.users u ON u.id = p.client_id
+  WHERE p.id = (p_snapshot->>'portfolio_id')::uuid
+    AND (p.client_id = p_user_id OR u.manager_id = p_user_id)
+  ON CONFLICT (portfolio_id, snapshot_date) DO UPDATE SET
+    total_value = EXCLUDED.total_value,
+    invested_value = EXCLUDED.invested_value,
+    returns_amount = EXCLUDED.returns_amount,
+    returns_percent = EXCLUDED.returns_percent,
+    holdings_count = EXCLUDED.holdings_count,
+    snapshot_data = EXCLUDED.snapshot_data
+  RETURNING *;
+$$;
+
+-- Takes the user id as an argument, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.create_portfolio_snapshot(uuid, jsonb)
+  FROM public, anon, authenticated;
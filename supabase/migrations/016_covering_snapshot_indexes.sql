@@ -0,0 +1,20 @@
+-- Migration 016: Covering indexes for snapshot and watchlist reads
+--
+-- portfolio_period_metrics (013) and GET /portfolios/{id}/snapshots look up
+-- snapshots by portfolio_id and snapshot_date and read only the scalar
+-- columns. Carrying those columns in the index lets Postgres answer from
+-- the index alone and skip the heap, where the wide snapshot_data JSONB lives.
+-- It replaces idx_portfolio_snapshots_portfolio_date, the plain
+-- (portfolio_id, snapshot_date DESC) index from 008;
+-- the unique (portfolio_id, snapshot_date) index stays for the upsert.
+--
+-- watchlist_items are always read per watchlist in added_at order.
+
+CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_pid_date_covering
+  ON public.portfolio_snapshots (portfolio_id, snapshot_date DESC)
+  INCLUDE (total_value, invested_value, returns_amount, returns_percent, holdings_count);
+
+DROP INDEX IF EXISTS public.idx_portfolio_snapshots_portfolio_date;
+
+CREATE INDEX IF NOT EXISTS idx_watchlist_items_watchlist_added
+  ON public.watchlist_items (watchlist_id, added_at);
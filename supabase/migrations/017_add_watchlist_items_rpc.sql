@@ -0,0 +1,28 @@
+-- Migration 017: Owner-checked bulk watchlist item upsert
+--
+-- Multi-row version of add_watchlist_item (012) for
+-- POST /watchlists/{id}/items/bulk. p_items is a JSON array of
+-- {"symbol": ..., "name": ...}; symbols must be unique within the batch.
+-- Returns the upserted rows, or none if the watchlist is not the user's.
+
+CREATE OR REPLACE FUNCTION public.add_watchlist_items(
+  p_user_id uuid,
+  p_watchlist_id uuid,
+  p_items jsonb
+)
+RETURNS SETOF public.watchlist_items
+LANGUAGE sql
+AS $$
+  INSERT INTO public.watchlist_items (watchlist_id, symbol, name)
+  SELECT w.id, i.symbol, coalesce(i.name, '')
+  FROM public.watchlists w
+  CROSS JOIN jsonb_to_recordset(p_items) AS i(symbol text, name text)
+  WHERE w.id = p_watchlist_id
+    AND w.user_id = p_user_id
+  ON CONFLICT (watchlist_id, symbol) DO UPDATE SET name = EXCLUDED.name
+  RETURNING *;
+$$;
+
+-- Takes the user id as an argument, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.add_watchlist_items(uuid, uuid, jsonb)
+  FROM public, anon, authenticated;